@@ -12,15 +12,56 @@ import datetime
 from os.path import join
 import numpy as np
 import pandas as pd
-import plotly.graph_objects as go
-from plotly.subplots import make_subplots
+from history import Contributions, PriceHistory
+from instrumentation import instrumented
+from plotting import COLORS, POINT_BUDGET, figure_template, line_trace
+from projection import project_balance
+from scenarios import score_redistributions, what_if_table
+from seasonality import monthly_loss_counts
+from valuation import SUMMARY_COLUMNS, value_contributions
 
 
-def import_data():
+@instrumented(rows=lambda result: len(result[0]))
+def load_contributions(contributions_path, current_share_prices, cache=True):
+    """Import one contribution history and value it at the latest share prices.
+
+    Args:
+        contributions_path: contributions CSV, as written by `import_investment_activity.import_contributions`
+        current_share_prices: share price history, newest first
+        cache: read the CSV through the binary cache of `csv_cache`; False for files read only once
+
+    Returns:
+        Dataframe: contribution history in dollars, oldest first
+        Dataframe: contribution history in shares, with the funds of the share price history
+        ndarray: total shares owned
+        Series: current dollar value per fund
+        float: current total balance
+
+    """
+    # Shares columns follow the share price columns by fund name, e.g. 'G Fund' is stored as 'G FUND'
+    contrib = Contributions.read_csv(contributions_path, funds=current_share_prices.columns, cache=cache)
+    contribs_dollars = contrib.dollars_frame()
+    contribs_shares = contrib.shares_frame()
+
+    current_shares = contrib.current_shares()
+    current_dollars = current_shares * current_share_prices.iloc[0]
+    balance_dollars = sum(current_dollars)
+
+    return contribs_dollars, contribs_shares, current_shares, current_dollars, balance_dollars
+
+
+@instrumented(rows=lambda result: len(result[0]))
+def import_data(contributions_path=join('resources', 'contributions.csv'),
+                prices_path=join('resources', 'Share_Prices.csv'), dtype=np.float64):
     """Import share price and contribution history and format into dataframes.
 
+    Args:
+        contributions_path: contributions CSV to import
+        prices_path: share price CSV to import
+        dtype: np.float64, or np.float32 to halve the memory of the share prices (see `history.PriceHistory`)
+
     Returns:
-        Dataframe: share price history
+        Dataframe: share price history, newest first without duplicated dates, in memory and writeable
         Dataframe: contribution history in dollars
         Dataframe: contribution history in shares
         ndarray: total shares owned
@@ -28,295 +69,201 @@ def import_data():
         float: current total balance
 
     """
-    current_share_prices = pd.read_csv(join('resources', 'share_prices.csv'))
-    current_share_prices = current_share_prices.set_index(['Date'])
-    current_share_prices.index = pd.to_datetime(current_share_prices.index, format='%m/%d/%Y')
-
-    contrib = pd.read_csv(join('resources', 'contributions.csv'))
-    contrib = contrib.set_index(['Date'])
-    contrib.index = pd.to_datetime(contrib.index, format='%m/%d/%Y')
-    contribs_dollars = contrib[['Traditional', 'Roth', 'Automatic_1', 'Matching', 'Total']]
-    contribs_shares = contrib.drop(columns=['Traditional', 'Roth', 'Automatic_1', 'Matching', 'Total'])
-    concat = pd.concat([current_share_prices, contribs_shares])
-
-    current_shares = []
-    for account in contribs_shares:
-        current_shares.append(sum(contribs_shares[account]))
-    current_shares = np.array(current_shares)
-    current_dollars = current_shares * current_share_prices.iloc[0]
-    balance_dollars = sum(current_dollars)
-    current_distribution = current_dollars / balance_dollars
+    # Copied out of the read-only memory map of the cache, so callers may edit the prices in place
+    current_share_prices = PriceHistory.read_csv(prices_path, dtype).to_frame(newest_first=True)
+    return (current_share_prices,) + load_contributions(contributions_path, current_share_prices)
 
-    return current_share_prices, contribs_dollars, contribs_shares, current_shares, current_dollars, balance_dollars
 
+@instrumented()
+def history_figure(data, point_budget=POINT_BUDGET, past_year=False, full_resolution_since=None):
+    """Figure of the share price history over all time, or just over the past year
 
-def plot_history(data):
-    """Plot the share price history data from 2014 to current and just over the past year
+    The lines are decimated to `point_budget` points before `full_resolution_since` and drawn in full after it, so
+    zooming into an earlier range shows the decimated line; pass the start of that range to see it in full.
 
     Args:
         data: share price history
+        point_budget: points per fund drawn before `full_resolution_since`
+        past_year: only show the past year
+        full_resolution_since: date from which every price is drawn, 52 weeks before the newest price by default
 
     Returns:
-         writes and saves plots
+        Figure
     """
-    fig = go.Figure()
+    import plotly.graph_objects as go
+    if full_resolution_since is None:
+        full_resolution_since = data.index.max() - pd.Timedelta(weeks=52)
+    if past_year:
+        data = data[:data.first_valid_index() - pd.Timedelta(weeks=52)]
+    fig = go.Figure(layout=dict(template=figure_template()))
     for col in data.columns:
-        fig.add_trace(go.Scatter(x=data.index, y=data[col], mode='lines', name=col))
-    fig.update_xaxes(title_text="Time",
-                     showline=True, mirror=True, linewidth=1, linecolor='black',
-                     zeroline=True, zerolinewidth=1, zerolinecolor='lightgrey',
-                     showgrid=True, gridwidth=1, gridcolor='lightgrey')
-    fig.update_yaxes(title_text="Share Price ($ USD)",
-                     showline=True,  mirror=True, linewidth=1, linecolor='black',
-                     zeroline=True, zerolinewidth=1, zerolinecolor='lightgrey',
-                     showgrid=True, gridwidth=1, gridcolor='lightgrey')
-    fig.update_layout(legend=dict(orientation="h", yanchor="bottom", y=-0.2, xanchor="center", x=0.5),
-                      font=dict(family='Times New Roman', size=15), plot_bgcolor='rgba(0,0,0,0)',
-                      margin_l=20, margin_r=20, margin_t=20, margin_b=20,)
+        fig.add_trace(line_trace(data.index, data[col], col, point_budget,
+                                 full_resolution_since=pd.Timestamp(full_resolution_since)))
+    fig.update_xaxes(title_text="Time")
+    fig.update_yaxes(title_text="Share Price ($ USD)")
+    return fig
+
+
+def plot_history(data, point_budget=POINT_BUDGET, full_resolution_since=None):
+    """Plot the share price history data from 2014 to current and just over the past year
 
+    Args:
+        data: share price history
+        point_budget: points per fund drawn before `full_resolution_since`
+        full_resolution_since: see `history_figure`
+
+    Returns:
+         writes and saves plots
+    """
+    fig = history_figure(data, point_budget, full_resolution_since=full_resolution_since)
     # fig.write_image(join('..', 'docs', 'share_prices_all_time.png'), height=700, width=900, engine='kaleido')
-    # fig.write_html(join('..', 'docs', 'share_prices_all_time.html'))
+    # fig.write_html(join('..', 'docs', 'share_prices_all_time.html'), include_plotlyjs='cdn')
     fig.show()
 
-    recent = data[:data.first_valid_index() - pd.Timedelta(weeks=52)]
-    fig = go.Figure()
-    for col in data.columns:
-        fig.add_trace(go.Scatter(x=recent.index, y=recent[col], mode='lines', name=col))
-    fig.update_xaxes(title_text="Time",
-                     showline=True, mirror=True, linewidth=1, linecolor='black',
-                     zeroline=True, zerolinewidth=1, zerolinecolor='lightgrey',
-                     showgrid=True, gridwidth=1, gridcolor='lightgrey')
-    fig.update_yaxes(title_text="Share Price ($ USD)",
-                     showline=True, mirror=True, linewidth=1, linecolor='black',
-                     zeroline=True, zerolinewidth=1, zerolinecolor='lightgrey',
-                     showgrid=True, gridwidth=1, gridcolor='lightgrey')
-    fig.update_layout(legend=dict(orientation="h", yanchor="bottom", y=-0.2, xanchor="center", x=0.5),
-                      font=dict(family='Times New Roman', size=15), plot_bgcolor='rgba(0,0,0,0)',
-                      margin_l=20, margin_r=20, margin_t=20, margin_b=20,)
-
+    fig = history_figure(data, point_budget, past_year=True)
     # fig.write_image(join('..', 'docs', 'share_prices_past_year.png'), height=700, width=900, engine='kaleido')
-    # fig.write_html(join('..', 'docs', 'share_prices_past_year.html'))
+    # fig.write_html(join('..', 'docs', 'share_prices_past_year.html'), include_plotlyjs='cdn')
     # fig.show()
 
 
-def plot_my_history(share_history, contrib_shares, contrib_dollars):
-    """Plot personal contributions and fund value over time.
+@instrumented()
+def my_history_figure(contrib_dollars_compound, point_budget=POINT_BUDGET):
+    """Figure of personal contributions and fund value over time.
+
     Args:
-        share_history: share price history
-        contrib_shares: contribution in share amounts
-        contrib_dollars: contribution in dollar amount
+        contrib_dollars_compound: valuation of the contributions, from `value_contributions`
+        point_budget: most points drawn per line
 
     Returns:
-        writes and saves plots
-
+        Figure
     """
-    color = ['royalblue', 'crimson', 'mediumseagreen', 'mediumpurple', 'darkorange', 'turquoise', 'deeppink', 'gold',
-             'lawngreen', 'sienna']
-
-    for i in range(len(contrib_shares)):
-        # Concatenate share values
-        try:
-            temp_df = contrib_shares_compound.iloc[i - 1] + contrib_shares.iloc[i]
-            temp_df = temp_df.to_frame().transpose()
-            temp_df['Date'] = [contrib_shares.index.values[i]]
-            temp_df = temp_df.set_index('Date', drop=True)
-            contrib_shares_compound = pd.concat([contrib_shares_compound, temp_df])
-        except UnboundLocalError:
-            contrib_shares_compound = contrib_shares.iloc[i].to_frame().transpose()
-
-        # Convert shares to dollar values
-        contrib_value = contrib_shares_compound.iloc[i] * share_history.loc[contrib_shares_compound.iloc[i].name]
-        contrib_value['Total Value'] = contrib_value.sum()
-        try:
-            contrib_value['Total Contribution'] = contrib_dollars.iloc[i]['Total'] + contrib_dollars_compound.iloc[i - 1]['Total Contribution']
-        except UnboundLocalError:
-            contrib_value['Total Contribution'] = contrib_dollars.iloc[i]['Total']
-        contrib_value['Fund Gain'] = contrib_value['Total Value'] - contrib_value['Total Contribution']
-        temp_df = contrib_value.to_frame().transpose()
-        temp_df['Date'] = [contrib_shares.index.values[i]]
-        temp_df = temp_df.set_index('Date', drop=True)
-        try:
-            contrib_dollars_compound = pd.concat([contrib_dollars_compound, temp_df])
-        except UnboundLocalError:
-            contrib_dollars_compound = temp_df
-
-    # Calculate my personal contribution
-    contrib_dollars['my_contrib'] = contrib_dollars['Traditional'] + contrib_dollars['Roth']
-    contrib_dollars['my_contrib_sum'] = contrib_dollars['my_contrib'].cumsum()
+    from plotly.subplots import make_subplots
+    dates = contrib_dollars_compound.index
 
     # Plot fund value
     fig = make_subplots(specs=[[{"secondary_y": True}]])
-    fig.add_trace(go.Scatter(x=contrib_dollars_compound.index, y=contrib_dollars_compound['Total Value'],
-                             name='Total Value', mode='lines+markers', line=dict(color=color[0], width=2)),
-                  secondary_y=False,)
-    fig.add_trace(go.Scatter(x=contrib_dollars_compound.index, y=contrib_dollars_compound['Total Contribution'],
-                             name='Total Contribution', mode='lines+markers', line=dict(color=color[1], width=2)),
-                  secondary_y=False,)
-    fig.add_trace(go.Scatter(x=contrib_dollars_compound.index, y=contrib_dollars['my_contrib_sum'],
-                             name='My Contribution', mode='lines+markers', line=dict(color=color[2], width=2)),
-                  secondary_y=False,)
-    fig.add_trace(go.Scatter(x=contrib_dollars_compound.index, y=contrib_dollars_compound['Fund Gain'], # fill='tozeroy',
-                             name='Fund Gain', mode='lines', line=dict(color=color[3], width=2)), secondary_y=True, )
+    fig.update_layout(template=figure_template())
+    for i, col in enumerate(['Total Value', 'Total Contribution', 'My Contribution']):
+        fig.add_trace(line_trace(dates, contrib_dollars_compound[col], col, point_budget, mode='lines+markers',
+                                 line=dict(color=COLORS[i % len(COLORS)], width=2)), secondary_y=False,)
+    fig.add_trace(line_trace(dates, contrib_dollars_compound['Fund Gain'], 'Fund Gain', point_budget,  # fill='tozeroy',
+                             line=dict(color=COLORS[3], width=2)), secondary_y=True, )
     i = 4
-    for col in contrib_dollars_compound.columns:
-        if max(contrib_dollars_compound[col]) > 0 and col != 'Total Value' and col != 'Total Contribution' and col != 'Fund Gain':
-            fig.add_trace(go.Scatter(x=contrib_dollars_compound.index, y=contrib_dollars_compound[col], mode='lines', name=col,
-                                     line=dict(color=color[i], width=2)), secondary_y=False,)
+    for col in contrib_dollars_compound.columns.drop(SUMMARY_COLUMNS):
+        if contrib_dollars_compound[col].max() > 0:
+            fig.add_trace(line_trace(dates, contrib_dollars_compound[col], col, point_budget,
+                                     line=dict(color=COLORS[i % len(COLORS)], width=2)), secondary_y=False,)
             i += 1
 
-    fig.update_xaxes(title_text="Time",
-                     showline=True, mirror=True, linewidth=1, linecolor='black',
-                     zeroline=True, zerolinewidth=1, zerolinecolor='lightgrey',
-                     showgrid=True, gridwidth=1, gridcolor='lightgrey')
-    fig.update_yaxes(title_text="Value ($ USD)", secondary_y=False, rangemode='tozero',
-                     showline=True,  mirror=True, linewidth=1, linecolor='black',
-                     zeroline=True, zerolinewidth=1, zerolinecolor='lightgrey',
-                     showgrid=True, gridwidth=1, gridcolor='lightgrey')
-    fig.update_yaxes(title_text="Fund Gains ($ USD)", secondary_y=True, rangemode='tozero',
-                     showline=True, mirror=True, linewidth=1, linecolor='black',
-                     zeroline=True, zerolinewidth=1, zerolinecolor='lightgrey',
-                     showgrid=True, gridwidth=1, gridcolor='lightgrey')
-    fig.update_layout(legend=dict(orientation="h", yanchor="bottom", y=-0.2, xanchor="center", x=0.5),
-                      font=dict(family='Times New Roman', size=15), plot_bgcolor='rgba(0,0,0,0)',
-                      margin_l=20, margin_r=20, margin_t=20, margin_b=20,)
+    fig.update_xaxes(title_text="Time")
+    fig.update_yaxes(title_text="Value ($ USD)", secondary_y=False, rangemode='tozero')
+    fig.update_yaxes(title_text="Fund Gains ($ USD)", secondary_y=True, rangemode='tozero')
+    return fig
 
+
+def plot_my_history(share_history, contrib_shares, contrib_dollars, point_budget=POINT_BUDGET):
+    """Plot personal contributions and fund value over time.
+    Args:
+        share_history: share price history
+        contrib_shares: contribution in share amounts
+        contrib_dollars: contribution in dollar amount
+        point_budget: most points drawn per line
+
+    Returns:
+        writes and saves plots
+
+    """
+    fig = my_history_figure(value_contributions(share_history, contrib_shares, contrib_dollars), point_budget)
     # fig.write_image(join('..', 'docs', 'my_fund_value.png'), height=700, width=900, engine='kaleido')
-    # fig.write_html(join('..', 'docs', 'my_fund_value.html'))
+    # fig.write_html(join('..', 'docs', 'my_fund_value.html'), include_plotlyjs='cdn')
     fig.show()
 
 
-def calculate_futures(current_balance, today_shares_owned, history, range_days, redistribution):
+def calculate_futures(current_balance, today_shares_owned, history, range_days, redistribution, price_index=None):
     """ Calculate future distributions of TSP funds.
     :param current_balance: current balance of TSP account
     :param today_shares_owned: current amount of shares owned
-    :param history:
-    :param range_days:
-    :param redistribution:
-    :return:
+    :param history: share price history, newest first
+    :param range_days: number of most recent trading days to take the maximum share price over
+    :param redistribution: fraction of the balance to move into each fund
+    :param price_index: optional PriceRangeIndex built once over history, for constant-time window maxima
+    :return: gain/loss of the redistribution compared to the current distribution
     """
-    today_fund_value = today_shares_owned * history.iloc[0]
-    current_distribution = today_fund_value / current_balance
+    return score_redistributions(redistribution, [range_days], current_balance, today_shares_owned, history,
+                                 price_index)[0, 0]
 
-    range_max_price = []
-    overall_max_price = []
-    for account in history:
-        range_max_price.append(max(history[account][:range_days]))
-        overall_max_price.append(max(history[account][:]))
-    new_fund_distribution = redistribution * current_balance  # move dollar balance to new redistribution
-    new_shares_after_distribution = new_fund_distribution/history.iloc[0]
 
-    new_share_range_max_price = new_shares_after_distribution * range_max_price
-    potential_range_gain_loss = new_share_range_max_price - new_fund_distribution
-    potential_total = sum(new_share_range_max_price)
-    total_gain_loss = potential_total - current_balance
+@instrumented(rows=len)
+def find_what_if_redis(ranges, redistribution, current_balance, current_shares, prices_history, price_index=None):
+    """Score every redistribution against every look-back window in one pass.
 
-    current_shares_at_range_max_price = today_shares_owned * range_max_price
-    tot = sum(current_shares_at_range_max_price)
-    est_gain_loss = tot - current_balance
-    current_distrib_v_scenario = total_gain_loss - est_gain_loss
-
-    return current_distrib_v_scenario
+    Args:
+        ranges: look-back windows in trading days, e.g. [15, 30, 280, len(prices_history)]
+        redistribution: scenarios x funds array of fractions of the balance to put in each fund
+        current_balance: current balance of TSP account
+        current_shares: current amount of shares owned
+        prices_history: share price history
+        price_index: optional PriceRangeIndex built once over prices_history
 
+    Returns:
+        DataFrame: gains/losses per redistribution (rows) and window (columns)
 
-def find_what_if_redis(ranges, redistribution, current_balance, current_shares, prices_history):
     """
+    return what_if_table(ranges, redistribution, current_balance, current_shares, prices_history, price_index)
 
+
+@instrumented()
+def what_if_figure(df):
+    """ Bar chart of the "what-if" redistribution gains and losses.
     Args:
-        ranges:
-        redistribution:
-        current_balance:
-        current_shares:
-        prices_history:
+        df (DataFrame): gains/losses per redistribution and window, from `find_what_if_redis`
 
     Returns:
-
+        Figure
     """
-    df = pd.DataFrame(columns=['Redistribution', str(ranges[0])+' days', str(ranges[1])+' days', str(ranges[2])+' days', 'Over All Time'])
-    for i in range(len(redistribution)):
-        redis = redistribution[i, :]
-        temp = [i]
-        for days in [15, 30, 280, len(prices_history)]:
-            temp.append(calculate_futures(current_balance, current_shares, prices_history, days, redis))
-        df = df.append(pd.Series(temp, index=df.columns), ignore_index=True)
-    return df.set_index('Redistribution')
+    import plotly.graph_objects as go
+    fig = go.Figure(layout=dict(template=figure_template()))
+    for col in df.columns:
+        fig.add_trace(go.Bar(x=df[col].index, y=df[col].values, name=col))
+    fig.update_xaxes(title_text="Gains/Losses ($ USD)", zeroline=False, showgrid=False)
+    fig.update_yaxes(title_text="Gains/Losses ($ USD)", zerolinewidth=2, zerolinecolor='grey')
+    fig.update_layout(legend_y=-0.25, xaxis=dict(tickmode='linear', tick0=1, dtick=1,))
+    return fig
 
 
 def plot_what_if(df):
-    """ Plot the share price history data from 2014 to current.
+    """ Plot the "what-if" redistribution gains and losses.
     Args:
-        df (DataFrame): dataframe of share price history
+        df (DataFrame): gains/losses per redistribution and window, from `find_what_if_redis`
 
     Returns:
 
     """
-    fig = go.Figure()
-    for col in df.columns:
-        fig.add_trace(go.Bar(x=df[col].index, y=df[col].values, name=col))
-    fig.update_xaxes(title_text="Gains/Losses ($ USD)",
-                     showline=True, mirror=True, linewidth=1, linecolor='black',
-                     zeroline=False, zerolinewidth=1, zerolinecolor='lightgrey',
-                     showgrid=False, gridwidth=1, gridcolor='lightgrey')
-    fig.update_yaxes(title_text="Gains/Losses ($ USD)",
-                     showline=True, mirror=True, linewidth=1, linecolor='black',
-                     zeroline=True, zerolinewidth=2, zerolinecolor='grey',
-                     showgrid=True, gridwidth=1, gridcolor='lightgrey')
-    fig.update_layout(legend=dict(orientation="h", yanchor="bottom", y=-0.25, xanchor="center", x=0.5),
-                      font=dict(family='Times New Roman', size=15), plot_bgcolor='rgba(0,0,0,0)',
-                      margin_l=20, margin_r=20, margin_t=20, margin_b=20,
-                      xaxis=dict(tickmode='linear', tick0=1, dtick=1,))
-
-
+    fig = what_if_figure(df)
     # fig.write_image(join('..', 'docs', 'redistribution.png'), height=700, width=900, engine='kaleido')
-    # fig.write_html(join('..', 'docs', 'redistribution.html'))
+    # fig.write_html(join('..', 'docs', 'redistribution.html'), include_plotlyjs='cdn')
     fig.show()
 
 
-def gain_loss_whole_month(current_data):
-    """ Calculate monthly gains/losses of each fund over all years. """
-    months = current_data.groupby(pd.Grouper(freq='MS'))
-    losses_monthly = pd.DataFrame(0, columns=current_data.columns, index=['Jan', 'Feb', 'Mar', 'Apr', 'May', 'Jun',
-                                                                          'Jul', 'Aug', 'Sep', 'Oct', 'Nov', 'Dec'])
-    for mo in months:
-        # Per month per year, subtract final value from starting value
-        diff = (mo[1].iloc[-1] - mo[1].iloc[0]).rename(mo[0])
-        mon_str = str(diff.name.month_name()[:3])
-        for index, val in diff.items():
-            if val < 0:
-                losses_monthly.loc[mon_str, index] = losses_monthly.loc[mon_str, index] + 1
-
-    return losses_monthly
-
-
-def gain_loss_month_daily(current_data):
-    """ Calculate monthly sum of daily gains/losses of each fund over all years. """
-    months = current_data.groupby(pd.Grouper(freq='MS'))
-    losses_monthly = pd.DataFrame(0, columns=current_data.columns, index=['Jan', 'Feb', 'Mar', 'Apr', 'May', 'Jun',
-                                                                          'Jul', 'Aug', 'Sep', 'Oct', 'Nov', 'Dec'])
-    for mo in months:
-        # Per month per year, sum daily gains/losses
-        monthly_sum = np.zeros((mo[1].shape[1],))
-        for i in range(mo[1].shape[0] - 1):
-            # loop over all days in month, except last day
-            monthly_sum = monthly_sum + (mo[1].iloc[i+1] - mo[1].iloc[i])
-        mon_str = str(mo[0].month_name()[:3])
-        for index, val in monthly_sum.items():
-            if val < 0:
-                losses_monthly.loc[mon_str, index] = losses_monthly.loc[mon_str, index] + 1
-
-    return losses_monthly
+def gain_loss_whole_month(current_data, funds=None):
+    """ Count, per calendar month, the years in which each fund ended the month lower than it started.
 
+    See seasonality.seasonality_stats for mean/median returns, hit rates and weekly or day-of-week statistics.
+    """
+    return monthly_loss_counts(current_data, funds, method='period')
 
-def main():
-    # Do all the importing and calculations
-    prices_history, contrib_dollars, contrib_shares, current_shares, current_dollars, current_balance = import_data()
 
-    # Plot share performance over all time
-    plot_history(prices_history)
+def gain_loss_month_daily(current_data, funds=None):
+    """ Count, per calendar month, the years in which the sum of each fund's daily dollar price changes was a loss.
 
-    # Plot your personal performance over time
-    plot_my_history(prices_history, contrib_shares, contrib_dollars)
+    The daily changes within a month add up to the change from its first to its last price, so the counts are those of
+    gain_loss_whole_month. For sums of daily percentage returns use seasonality_stats with method='daily'.
+    """
+    return monthly_loss_counts(current_data, funds, method='period')
 
-    # Output your current status
+
+def print_summary(contrib_dollars, current_shares, current_dollars, current_balance):
+    """Print the total balance, the gains on contributions and the current shares held."""
     print(f"Total fund value:             ${current_balance:,.2f}")
     my_input = np.sum(contrib_dollars['Traditional']) + np.sum(contrib_dollars['Roth'])
     all_input = np.sum(contrib_dollars['Total'])
@@ -329,13 +276,50 @@ def main():
             print(f"  {current_dollars.axes[0][i]}: {current_shares[i]:.4f}    ${current_dollars.iloc[i]:,.2f}    "
                   f"{100*current_dollars.iloc[i]/current_balance:.2f}%")
 
+
+def print_projection(prices_history, contrib_dollars, current_dollars, current_balance, future_year=None,
+                     contribution=None, n_paths=100_000, seed=0):
+    """Print the Monte Carlo percentile bands of the balance at the start of a future year.
+
+    Args:
+        prices_history: share price history
+        contrib_dollars: contribution history in dollars
+        current_dollars: current dollar value per fund
+        current_balance: current total balance
+        future_year: year to project to, five years from now by default; a year not starting at least one business
+            day from now is reported instead of projected
+        contribution: biweekly contribution, the last one by default
+        n_paths: number of simulated paths
+        seed: seed for reproducible projections
+    """
+    future_year = datetime.date.today().year + 5 if future_year is None else future_year
+    target_date = datetime.date(year=future_year, month=1, day=1)
+    if np.busday_count(datetime.date.today(), target_date) <= 0:
+        print(f"\nCannot project to {future_year}, which does not start at least one business day from now")
+        return
+    contribution = contrib_dollars.iloc[-1]['Total'] if contribution is None else contribution
+    bands = project_balance(prices_history, current_dollars / current_balance, current_balance, contribution,
+                            target_date, n_paths=n_paths, seed=seed)
+    print(f"\nProjected value in {future_year} with biweekly contributions of ${contribution:,.2f} (no inflation)")
+    for percentile, value in bands.iloc[-1].items():
+        print(f"  {percentile:>4}: ${value:,.2f}")
+
+
+def main():
+    # Do all the importing and calculations
+    prices_history, contrib_dollars, contrib_shares, current_shares, current_dollars, current_balance = import_data()
+
+    # Plot share performance over all time
+    plot_history(prices_history)
+
+    # Plot your personal performance over time
+    plot_my_history(prices_history, contrib_shares, contrib_dollars)
+
+    # Output your current status
+    print_summary(contrib_dollars, current_shares, current_dollars, current_balance)
+
     # See how much value you'll have in a future year (for example, when you turn 25, 30, 40, 60)
-    future_year = 2027
-    time_to_future = datetime.datetime(year=future_year, month=1, day=1) - datetime.datetime.now()
-    last_contrib = contrib_dollars.iloc[-1]['Total']
-    number_of_contribs = 2 * time_to_future.days/30
-    value_2027 = all_input + number_of_contribs * last_contrib
-    print(f"\nEstimated value in {future_year} from only contributions (no inflation): ${value_2027:,.2f}")
+    print_projection(prices_history, contrib_dollars, current_dollars, current_balance)
 
     # # Test different distributions to see the possible gains/losses in switching to them, using the number code:
     # # 7  = L 2055
@@ -363,12 +347,33 @@ def main():
     # print('\n\"What-if\" Redistribution Gains and Losses')
     # print(df)
     #
-    # gain_loss = gain_loss_whole_month(prices_history)
+    # # Or search for the best allocation of the core funds, with at most 60% in any one fund
+    # from optimizer import CORE_FUNDS, optimize_allocation
+    # best, score = optimize_allocation(prices_history, current_shares, objective='sharpe', funds=CORE_FUNDS,
+    #                                   max_weight=0.6)
+    # print(f'\nBest allocation (Sharpe ratio {score:.2f})')
+    # print(best[best > 0])
+    #
+    # # Replay other strategies against your real contributions
+    # from backtest import FixedWeights, GlidePath, run_backtests
+    # strategies = {'C Fund only': FixedWeights({'C FUND': 1}),
+    #               '60/40 C/F, rebalanced quarterly': FixedWeights({'C FUND': 0.6, 'F FUND': 0.4}, 'quarterly'),
+    #               'Glide from C to G': GlidePath({'C FUND': 0.9, 'G FUND': 0.1}, {'C FUND': 0.3, 'G FUND': 0.7},
+    #                                              '2020-01-01', '2050-01-01')}
+    # equity_curves, backtest_summary = run_backtests(prices_history, contrib_dollars, strategies)
+    # print(backtest_summary)
+    #
+    # # Rolling risk metrics, kept up to date day by day in resources/.cache/risk_metrics.npz
+    # from risk_metrics import update_risk_metrics
+    # risk = update_risk_metrics(prices_history, join('resources', '.cache', 'risk_metrics.npz'))
+    # print(risk.snapshot()[['volatility', 'beta', 'max_drawdown', 'return_252d']])
+    #
+    # gain_loss = gain_loss_whole_month(prices_history, ['C FUND', 'S FUND', 'I FUND', 'F FUND'])
     # print('\nWhole Month Monthly Losses')
-    # print(gain_loss[['C FUND', 'S FUND', 'I FUND', 'F FUND']])
-    # gain_loss2 = gain_loss_month_daily(prices_history)
+    # print(gain_loss)
+    # gain_loss2 = gain_loss_month_daily(prices_history, ['C FUND', 'S FUND', 'I FUND', 'F FUND'])
     # print('\nDaily Sum Monthly Losses')
-    # print(gain_loss2[['C FUND', 'S FUND', 'I FUND', 'F FUND']])
+    # print(gain_loss2)
 
 
 if __name__ == '__main__':
@@ -0,0 +1,133 @@
+"""
+accounts.py
+
+Batch analysis of many participants: loads `Share_Prices.csv` once and streams a directory of contribution files
+through the valuation and the summary printed by `TSP_analysis.main`, producing one consolidated table with a row per
+account. Accounts are processed in worker processes that each read the cached price history (see `csv_cache`) into a
+compact `history.PriceHistory`, optionally as float32, instead of receiving a pickled copy. The contribution files are
+each read once, so they are parsed directly and never written to the cache. Every worker holds only one account at a
+time, so memory stays bounded however many accounts there are.
+
+Run from src/main:
+    python accounts.py accounts/ --output account_summary.csv
+"""
+import argparse
+from concurrent.futures import ProcessPoolExecutor
+from glob import glob
+import os
+from os.path import basename, join, splitext
+import numpy as np
+import pandas as pd
+
+from csv_cache import read_dated_csv
+from history import PriceHistory
+from instrumentation import instrumented
+from TSP_analysis import load_contributions
+from valuation import value_contributions
+
+ACCOUNT_COLUMNS = ['Total Value', 'Total Contribution', 'My Contribution', 'Gain on My Contribution', 'Fund Gain',
+                   'Peak Value', 'Contributions', 'First Contribution', 'Last Contribution']
+
+_worker = {}
+
+
+@instrumented()
+def account_summary(share_history, contributions_path, asof_index=None):
+    """Balance, contributions and gains of one account, plus its current value per fund.
+
+    Args:
+        share_history: share price history, newest first
+        contributions_path: contributions CSV of the account
+        asof_index: optional `AsOfIndex` built once over share_history and shared by all accounts
+
+    Returns:
+        dict: the `ACCOUNT_COLUMNS` followed by the current dollar value of every fund held
+    """
+    # Each account file is read once, so it is parsed directly rather than written to the binary cache
+    contrib_dollars, contrib_shares, current_shares, current_dollars, current_balance = \
+        load_contributions(contributions_path, share_history, cache=False)
+    valuation = value_contributions(share_history, contrib_shares, contrib_dollars, asof_index)
+    my_contribution = contrib_dollars['Traditional'].sum() + contrib_dollars['Roth'].sum()
+    total_contribution = contrib_dollars['Total'].sum()
+    summary = {'Total Value': current_balance,
+               'Total Contribution': total_contribution,
+               'My Contribution': my_contribution,
+               'Gain on My Contribution': current_balance - my_contribution,
+               'Fund Gain': current_balance - total_contribution,
+               'Peak Value': max(valuation['Total Value'].max(), current_balance),
+               'Contributions': len(contrib_dollars),
+               'First Contribution': contrib_dollars.index.min(),
+               'Last Contribution': contrib_dollars.index.max()}
+    summary.update(current_dollars[current_shares > 0.001].to_dict())
+    return summary
+
+
+def _init_worker(prices_path, dtype):
+    """Load the share price history and its as-of index, sharing the same arrays, once per worker process."""
+    history = PriceHistory.read_csv(prices_path, dtype)
+    _worker['share_history'] = history.to_frame(newest_first=True)
+    _worker['asof_index'] = history.asof_index()
+
+
+def _summarize(contributions_path):
+    try:
+        return account_summary(_worker['share_history'], contributions_path, _worker['asof_index'])
+    except (OSError, KeyError, ValueError) as error:
+        return {'Error': f'{type(error).__name__}: {error}'}
+
+
+def summarize_accounts(contributions_dir, prices_path=join('resources', 'Share_Prices.csv'), pattern='*.csv',
+                       workers=None, chunk_size=16, dtype=np.float64):
+    """Summarize every contributions file in a directory against one share price history.
+
+    Args:
+        contributions_dir: directory of contributions CSVs, one per account, named after the account
+        prices_path: share price CSV
+        pattern: glob pattern of the contributions files in the directory
+        workers: number of worker processes, all cores by default; 1 runs in this process
+        chunk_size: accounts sent to a worker at once
+        dtype: np.float64, or np.float32 to halve the memory of the share prices in every worker
+
+    Returns:
+        DataFrame: one row per account (index) with the `ACCOUNT_COLUMNS` and the value per fund, in file name order.
+            Accounts whose file could not be read have NaN values and the reason in an 'Error' column.
+    """
+    paths = sorted(glob(join(contributions_dir, pattern)))
+    # Read the prices here first so the binary cache is built once, before any worker reads it
+    share_history = read_dated_csv(prices_path)
+    if workers == 1 or len(paths) <= 1:
+        _init_worker(prices_path, dtype)
+        rows = [_summarize(path) for path in paths]
+    else:
+        with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker,
+                                 initargs=(prices_path, dtype)) as executor:
+            rows = list(executor.map(_summarize, paths, chunksize=chunk_size))
+    table = pd.DataFrame.from_records(rows, index=[splitext(basename(path))[0] for path in paths])
+
+    funds = [fund for fund in share_history.columns if fund in table.columns]
+    extra = [column for column in table.columns if column not in ACCOUNT_COLUMNS and column not in funds]
+    table = table.reindex(columns=ACCOUNT_COLUMNS + funds + extra)
+    table.index.name = 'Account'
+    return table
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Summarize a directory of contributions files, one per account.')
+    parser.add_argument('contributions_dir', help='directory of contributions CSVs')
+    parser.add_argument('--prices', default=join('resources', 'Share_Prices.csv'), help='share price CSV')
+    parser.add_argument('--pattern', default='*.csv', help='glob pattern of the contributions files')
+    parser.add_argument('--workers', type=int, default=None, help='worker processes, all cores by default')
+    parser.add_argument('--float32', action='store_true', help='store the share prices as float32 in the workers')
+    parser.add_argument('--output', default=None, help='CSV to write the summary to, printed if not given')
+    args = parser.parse_args(argv)
+    table = summarize_accounts(args.contributions_dir, args.prices, args.pattern, args.workers,
+                               dtype=np.float32 if args.float32 else np.float64)
+    if args.output:
+        os.makedirs(os.path.dirname(args.output) or '.', exist_ok=True)
+        table.to_csv(args.output)
+    else:
+        print(table.to_string())
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,200 @@
+"""
+backtest.py
+
+Replays allocation and rebalancing strategies over the share price history with the real contribution dates and
+amounts from contributions.csv: "what would my account be worth if I had used allocation X with rebalancing rule Y?".
+Strategies run in a process pool; the price matrix is placed once in shared memory and every worker maps it instead of
+receiving a pickled copy.
+"""
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import shared_memory
+import numpy as np
+import pandas as pd
+
+from history import TRADING_DAYS_PER_YEAR, AsOfIndex, clean_prices
+from instrumentation import instrumented
+
+DEFAULT_FUND = 'G FUND'
+REBALANCE_PERIODS = {'monthly': 'M', 'quarterly': 'Q', 'annually': 'Y'}
+
+
+class FixedWeights:
+    """Invest every contribution in fixed weights, optionally rebalancing the whole balance back to them.
+
+    Args:
+        weights: dict of fraction of the balance per fund
+        rebalance: None to never rebalance, 'monthly', 'quarterly' or 'annually', or a number of trading days
+    """
+
+    def __init__(self, weights, rebalance=None):
+        self.weights = dict(weights)
+        self.rebalance = rebalance
+
+    def weights_at(self, date, funds):
+        return np.array([self.weights.get(fund, 0.0) for fund in funds])
+
+
+class GlidePath(FixedWeights):
+    """Move linearly from one allocation to another between two dates, like the L funds do.
+
+    Args:
+        start_weights: dict of fractions per fund on and before `start_date`
+        end_weights: dict of fractions per fund on and after `end_date`
+        start_date: date the glide starts
+        end_date: date the glide ends
+        rebalance: rebalancing rule, see `FixedWeights`; 'quarterly' by default so the balance follows the path
+    """
+
+    def __init__(self, start_weights, end_weights, start_date, end_date, rebalance='quarterly'):
+        super().__init__(start_weights, rebalance)
+        self.end_weights = dict(end_weights)
+        self.start_date = pd.Timestamp(start_date)
+        self.end_date = pd.Timestamp(end_date)
+
+    def weights_at(self, date, funds):
+        progress = (pd.Timestamp(date) - self.start_date) / (self.end_date - self.start_date)
+        progress = min(max(progress, 0.0), 1.0)
+        start = super().weights_at(date, funds)
+        end = np.array([self.end_weights.get(fund, 0.0) for fund in funds])
+        return (1 - progress) * start + progress * end
+
+
+def _rebalance_rows(dates, rule):
+    """Rows of the trading days a rebalancing rule rebalances on: the first trading day of each period."""
+    if rule is None:
+        return np.empty(0, dtype=int)
+    if isinstance(rule, int):
+        return np.arange(rule, len(dates), rule)
+    periods = pd.DatetimeIndex(dates).to_period(REBALANCE_PERIODS[rule]).asi8
+    return np.flatnonzero(periods[1:] != periods[:-1]) + 1
+
+
+def replay(prices, dates, funds, contribution_rows, contribution_amounts, strategy):
+    """Replay one strategy over the price history.
+
+    Args:
+        prices: trading days x funds array of share prices, oldest first, NaN where a fund had no price
+        dates: dates of the rows of `prices`
+        funds: fund names of the columns of `prices`
+        contribution_rows: sorted row of `prices` each contribution is invested on
+        contribution_amounts: dollars of each contribution
+        strategy: `FixedWeights`, `GlidePath` or any object with `weights_at(date, funds)` and `rebalance`
+
+    Returns:
+        ndarray: account value on every trading day from the first contribution on
+        ndarray: daily time-weighted returns, excluding the effect of contributions
+    """
+    first = contribution_rows[0]
+    available = np.isfinite(prices)
+    filled = np.where(available, prices, 0.0)
+
+    flows = np.zeros(len(prices))
+    np.add.at(flows, contribution_rows, contribution_amounts)
+    rebalance = _rebalance_rows(dates, strategy.rebalance)
+    rebalance = rebalance[rebalance > first]
+    events = np.union1d(np.unique(contribution_rows), rebalance)
+    rebalance = set(rebalance.tolist())
+
+    shares = np.zeros(len(funds))
+    value = np.zeros(len(prices))
+    for event, next_event in zip(events, np.append(events[1:], len(prices))):
+        weights = strategy.weights_at(dates[event], funds) * available[event]
+        if weights.sum() <= 0:
+            # None of the strategy's funds existed yet; the TSP default was to invest in the G Fund
+            weights = np.asarray(funds) == DEFAULT_FUND
+        weights = weights / weights.sum()
+        balance = shares @ filled[event]
+        if event in rebalance:
+            shares = (balance + flows[event]) * weights / np.where(available[event], prices[event], 1.0)
+        elif flows[event] >= 0:
+            shares = shares + flows[event] * weights / np.where(available[event], prices[event], 1.0)
+        elif balance > 0:
+            shares = shares * max(balance + flows[event], 0.0) / balance
+        value[event:next_event] = filled[event:next_event] @ shares
+
+    value = value[first:]
+    previous = np.concatenate([[np.nan], value[:-1]])
+    with np.errstate(divide='ignore', invalid='ignore'):
+        returns = np.where(previous > 0, (value - flows[first:]) / previous - 1, 0.0)
+    returns[0] = 0.0
+    return value, returns
+
+
+_shared = {}
+
+
+def _init_worker(shm_name, shape, dtype, dates, funds, contribution_rows, contribution_amounts):
+    """Map the shared price matrix in a worker process, once per worker."""
+    shm = shared_memory.SharedMemory(name=shm_name)
+    _shared.update(shm=shm, prices=np.ndarray(shape, dtype=dtype, buffer=shm.buf), dates=dates, funds=funds,
+                   contribution_rows=contribution_rows, contribution_amounts=contribution_amounts)
+
+
+def _replay_shared(strategy):
+    return replay(_shared['prices'], _shared['dates'], _shared['funds'], _shared['contribution_rows'],
+                  _shared['contribution_amounts'], strategy)
+
+
+def summarize(value, returns, contributed):
+    """Summary statistics of one equity curve."""
+    growth = np.cumprod(1 + returns)
+    years = max(len(returns) - 1, 1) / TRADING_DAYS_PER_YEAR
+    return {'Final Value': value[-1],
+            'Total Contribution': contributed,
+            'Gain': value[-1] - contributed,
+            'Annualized Return': growth[-1] ** (1 / years) - 1,
+            'Volatility': returns[1:].std() * np.sqrt(TRADING_DAYS_PER_YEAR),
+            'Max Drawdown': (growth / np.maximum.accumulate(growth) - 1).min()}
+
+
+@instrumented(rows=lambda result: len(result[0]))
+def run_backtests(share_history, contrib_dollars, strategies, start=None, workers=None):
+    """Replay many strategies over the share price history with the real contributions.
+
+    Args:
+        share_history: share price history, as returned by `import_data`
+        contrib_dollars: contribution history in dollars, as returned by `import_data`; the 'Total' column is invested
+        strategies: dict of strategy name to `FixedWeights`, `GlidePath` or similar strategy
+        start: first date to replay from; contributions before it are left out
+        workers: number of worker processes, all cores by default; 1 runs in this process
+
+    Returns:
+        DataFrame: equity curve per strategy (columns) on every trading day from the first contribution
+        DataFrame: Final Value, Total Contribution, Gain, Annualized Return, Volatility and Max Drawdown per strategy
+    """
+    history = clean_prices(share_history)
+    prices = np.ascontiguousarray(history.to_numpy(dtype=float))
+    dates = history.index.to_numpy()
+    funds = list(history.columns)
+    asof_index = AsOfIndex.from_frame(history)
+
+    contributions = contrib_dollars['Total'].sort_index(kind='stable')
+    if start is not None:
+        contributions = contributions[contributions.index >= pd.Timestamp(start)]
+    # Each contribution buys at the price of its date, or of the trading day before it when markets were closed
+    rows = asof_index.positions(contributions.index)
+    contributions, rows = contributions[rows >= 0], rows[rows >= 0]
+    if len(rows) == 0:
+        raise ValueError('No contributions within the share price history')
+    amounts = contributions.to_numpy(dtype=float)
+    names = list(strategies)
+
+    if workers == 1:
+        results = [replay(prices, dates, funds, rows, amounts, strategies[name]) for name in names]
+    else:
+        shm = shared_memory.SharedMemory(create=True, size=prices.nbytes)
+        try:
+            np.ndarray(prices.shape, dtype=prices.dtype, buffer=shm.buf)[:] = prices
+            with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker,
+                                     initargs=(shm.name, prices.shape, prices.dtype, dates, funds, rows,
+                                               amounts)) as executor:
+                results = list(executor.map(_replay_shared, [strategies[name] for name in names]))
+        finally:
+            shm.close()
+            shm.unlink()
+
+    index = pd.DatetimeIndex(dates[rows[0]:], name='Date')
+    curves = pd.DataFrame({name: value for name, (value, _) in zip(names, results)}, index=index)
+    summary = pd.DataFrame({name: summarize(value, returns, amounts.sum())
+                            for name, (value, returns) in zip(names, results)}).T
+    return curves, summary
@@ -0,0 +1,185 @@
+"""
+benchmark.py
+
+Benchmarks of the analysis hot paths on synthetic data (see `synthetic_data`) of configurable size. Every public
+function is timed on price histories of each requested length, and the what-if scoring also for each requested number
+of scenarios. Results are written as JSON, together with the library versions and machine, so runs can be compared
+over time with --compare.
+
+Run from src/main:
+    python benchmark.py --years 1 10 100 --scenarios 10 1000 10000 --compare benchmark_results/previous.json
+"""
+import argparse
+import datetime
+import json
+import os
+from os.path import join
+import platform
+import shutil
+import statistics
+import tempfile
+import time
+import numpy as np
+import pandas as pd
+
+import TSP_analysis
+from backtest import FixedWeights, run_backtests
+from csv_cache import read_dated_csv
+from optimizer import CORE_FUNDS, optimize_allocation
+from projection import project_balance
+from range_index import PriceRangeIndex
+from risk_metrics import rolling_risk_metrics
+from seasonality import seasonality_stats
+from synthetic_data import random_redistributions, synthetic_contributions, synthetic_prices, write_csv
+from valuation import value_contributions
+
+YEARS = (1, 10, 100)
+SCENARIOS = (10, 1000, 10000)
+
+
+def time_call(function, repeat=3, setup=None):
+    """Wall time of `repeat` calls of a function, with an untimed `setup` call before each one.
+
+    Returns:
+        dict: 'min', 'median' and 'max' seconds and 'repeat'
+    """
+    times = []
+    for _ in range(repeat):
+        if setup is not None:
+            setup()
+        start = time.perf_counter()
+        function()
+        times.append(time.perf_counter() - start)
+    return {'min': min(times), 'median': statistics.median(times), 'max': max(times), 'repeat': repeat}
+
+
+def _cases(workdir, years, scenarios, seed):
+    """(name, parameters, function, setup) of every benchmark at one history length."""
+    prices = synthetic_prices(years, seed=seed)
+    contributions = synthetic_contributions(prices, years=min(years, 30), seed=seed)
+    prices_path, contributions_path = join(workdir, 'Share_Prices.csv'), join(workdir, 'contributions.csv')
+    write_csv(prices, prices_path)
+    write_csv(contributions, contributions_path)
+    cache_dir = join(workdir, '.cache')
+
+    def clear_cache():
+        shutil.rmtree(cache_dir, ignore_errors=True)
+
+    read_dated_csv(prices_path)
+    contrib_dollars, contrib_shares, current_shares, current_dollars, current_balance = \
+        TSP_analysis.load_contributions(contributions_path, prices)
+    valuation = value_contributions(prices, contrib_shares, contrib_dollars)
+    weights = (current_dollars / current_balance).to_numpy()
+    ranges = [15, 30, 280, len(prices)]
+    funds = ['C FUND', 'S FUND', 'I FUND', 'F FUND']
+    size = {'years': years, 'rows': len(prices), 'contributions': len(contributions)}
+
+    cases = [
+        ('read_dated_csv cold', size, lambda: read_dated_csv(prices_path), clear_cache),
+        ('read_dated_csv warm', size, lambda: read_dated_csv(prices_path), None),
+        ('load_contributions', size, lambda: TSP_analysis.load_contributions(contributions_path, prices), None),
+        ('value_contributions', size, lambda: value_contributions(prices, contrib_shares, contrib_dollars), None),
+        ('history_figure', size, lambda: TSP_analysis.history_figure(prices), None),
+        ('my_history_figure', size, lambda: TSP_analysis.my_history_figure(valuation), None),
+        ('gain_loss_whole_month', size, lambda: TSP_analysis.gain_loss_whole_month(prices, funds), None),
+        ('gain_loss_month_daily', size, lambda: TSP_analysis.gain_loss_month_daily(prices, funds), None),
+        ('seasonality_stats weekday', size, lambda: seasonality_stats(prices, 'weekday'), None),
+        ('PriceRangeIndex', size, lambda: PriceRangeIndex(prices), None),
+        ('rolling_risk_metrics', size, lambda: rolling_risk_metrics(prices), None),
+        ('optimize_allocation sharpe', size,
+         lambda: optimize_allocation(prices, current_shares, 'sharpe', CORE_FUNDS, max_weight=0.6), None),
+        ('run_backtests', size,
+         lambda: run_backtests(prices, contrib_dollars, {'C': FixedWeights({'C FUND': 1}, 'quarterly'),
+                                                         'G': FixedWeights({'G FUND': 1})}, workers=1), None),
+        ('project_balance 10k paths', size,
+         lambda: project_balance(prices, weights, current_balance, 500.0, prices.index.max() + pd.DateOffset(years=10),
+                                 n_paths=10_000, seed=seed, start_date=prices.index.max()), None),
+    ]
+    price_index = PriceRangeIndex(prices)
+    for n_scenarios in scenarios:
+        redistribution = random_redistributions(n_scenarios, prices.shape[1], seed=seed)
+        params = dict(size, scenarios=n_scenarios)
+        cases.append(('find_what_if_redis', params,
+                      lambda r=redistribution: TSP_analysis.find_what_if_redis(ranges, r, current_balance,
+                                                                               current_shares, prices), None))
+        cases.append(('find_what_if_redis indexed', params,
+                      lambda r=redistribution: TSP_analysis.find_what_if_redis(ranges, r, current_balance,
+                                                                               current_shares, prices,
+                                                                               price_index), None))
+    return cases
+
+
+def run_benchmarks(years=YEARS, scenarios=SCENARIOS, repeat=3, only=None, seed=0):
+    """Time every benchmark at every size.
+
+    Args:
+        years: lengths of the synthetic price histories, in years
+        scenarios: numbers of what-if scenarios
+        repeat: timed calls per benchmark
+        only: substrings of the benchmark names to run, all benchmarks by default
+        seed: seed of the synthetic data
+
+    Returns:
+        dict: run metadata and one result per benchmark and size
+    """
+    results = []
+    for n_years in years:
+        with tempfile.TemporaryDirectory() as workdir:
+            for name, params, function, setup in _cases(workdir, n_years, scenarios, seed):
+                if only and not any(part in name for part in only):
+                    continue
+                timing = time_call(function, repeat, setup)
+                results.append({'name': name, 'params': params, **timing})
+                print(f"{name:<28} {json.dumps(params):<72} {timing['median'] * 1000:10.2f} ms")
+    return {'timestamp': datetime.datetime.now().isoformat(timespec='seconds'),
+            'python': platform.python_version(), 'numpy': np.__version__, 'pandas': pd.__version__,
+            'machine': platform.machine(), 'processor': platform.processor(), 'cpus': os.cpu_count(),
+            'seed': seed, 'results': results}
+
+
+def compare(previous, current):
+    """Median time ratio of every benchmark in both runs, current / previous.
+
+    Returns:
+        DataFrame: previous and current median seconds and their ratio, per benchmark and parameters
+    """
+    def medians(run):
+        return {(result['name'], json.dumps(result['params'], sort_keys=True)): result['median']
+                for result in run['results']}
+
+    before, after = medians(previous), medians(current)
+    keys = [key for key in after if key in before]
+    table = pd.DataFrame({'previous': [before[key] for key in keys], 'current': [after[key] for key in keys]},
+                         index=pd.MultiIndex.from_tuples(keys, names=['benchmark', 'params']))
+    table['ratio'] = table['current'] / table['previous']
+    return table
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Benchmark the TSP analysis on synthetic data.')
+    parser.add_argument('--years', type=float, nargs='+', default=list(YEARS), help='price history lengths')
+    parser.add_argument('--scenarios', type=int, nargs='+', default=list(SCENARIOS), help='what-if scenario counts')
+    parser.add_argument('--repeat', type=int, default=3, help='timed calls per benchmark')
+    parser.add_argument('--only', nargs='+', default=None, help='run only benchmarks whose name contains these')
+    parser.add_argument('--seed', type=int, default=0, help='seed of the synthetic data')
+    parser.add_argument('--output', default=None,
+                        help='JSON file to write, benchmark_results/<timestamp>.json by default')
+    parser.add_argument('--compare', default=None, help='earlier JSON results to compare against')
+    args = parser.parse_args(argv)
+
+    run = run_benchmarks(args.years, args.scenarios, args.repeat, args.only, args.seed)
+    output = args.output or join('benchmark_results', run['timestamp'].replace(':', '-') + '.json')
+    os.makedirs(os.path.dirname(output) or '.', exist_ok=True)
+    with open(output, 'w') as f:
+        json.dump(run, f, indent=2)
+    print(f'\nResults written to {output}')
+
+    if args.compare:
+        with open(args.compare) as f:
+            previous = json.load(f)
+        with pd.option_context('display.width', 200, 'display.max_columns', None, 'display.max_colwidth', 80):
+            print(compare(previous, run))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,222 @@
+"""
+cli.py
+
+Command line entry point of the TSP analysis, with one subcommand per task. Each subcommand imports only the modules
+it needs, so `summary` never loads Plotly or Selenium and starts fast enough to run from cron.
+
+Run from src/main:
+    python cli.py summary --project-to 2040
+    python cli.py plot --save ../docs
+    python cli.py whatif --ranges 15 30 280 --scenario "C FUND=0.6,F FUND=0.4" --scenario "I FUND=1"
+    python cli.py seasonality --period weekday --funds "C FUND" "S FUND"
+    python cli.py import activity InvestmentActivityDetail.csv
+    python cli.py report --output-dir report
+"""
+import argparse
+from os.path import join
+import sys
+
+RESOURCES = 'resources'
+
+
+def _load(args):
+    from TSP_analysis import import_data
+    return import_data(args.contributions, args.prices)
+
+
+def _load_prices(args):
+    from csv_cache import read_dated_csv
+    return read_dated_csv(args.prices)
+
+
+def parse_scenario(spec, funds):
+    """Fractions of the balance per fund from a spec like 'C FUND=0.6,F FUND=0.4', in the order of `funds`.
+
+    Fund names are matched in any case, and a bare letter such as 'C' stands for 'C FUND'.
+    """
+    import numpy as np
+    from share_prices import canonical_fund_name
+    positions = {fund: i for i, fund in enumerate(funds)}
+    weights = np.zeros(len(funds))
+    for part in spec.split(','):
+        name, _, fraction = part.rpartition('=')
+        fund = canonical_fund_name(name)
+        fund = fund if fund in positions else f'{fund} FUND'
+        if fund not in positions:
+            raise ValueError(f"Unknown fund '{name.strip()}' in scenario '{spec}'")
+        weights[positions[fund]] += float(fraction)
+    if not np.isclose(weights.sum(), 1.0):
+        raise ValueError(f"Scenario '{spec}' sums to {weights.sum():g}, not 1")
+    return weights
+
+
+def summary(args):
+    from TSP_analysis import print_projection, print_summary
+    prices_history, contrib_dollars, _, current_shares, current_dollars, current_balance = _load(args)
+    print_summary(contrib_dollars, current_shares, current_dollars, current_balance)
+    if args.project_to:
+        print_projection(prices_history, contrib_dollars, current_dollars, current_balance, args.project_to,
+                         args.contribution, args.paths)
+
+
+def plot(args):
+    import TSP_analysis
+    from valuation import value_contributions
+    prices_history, contrib_dollars, contrib_shares, _, _, _ = _load(args)
+    since = args.full_resolution_since
+    figures = {'share_prices_all_time': lambda: TSP_analysis.history_figure(prices_history, args.point_budget,
+                                                                            full_resolution_since=since),
+               'share_prices_past_year': lambda: TSP_analysis.history_figure(prices_history, args.point_budget, True,
+                                                                             since),
+               'my_fund_value': lambda: TSP_analysis.my_history_figure(
+                   value_contributions(prices_history, contrib_shares, contrib_dollars), args.point_budget)}
+    for name in args.figures:
+        fig = figures[name]()
+        if args.save:
+            fig.write_html(join(args.save, f'{name}.html'), include_plotlyjs='cdn')
+        else:
+            fig.show()
+
+
+def whatif(args):
+    import numpy as np
+    import pandas as pd
+    from TSP_analysis import find_what_if_redis
+    prices_history, _, _, current_shares, _, current_balance = _load(args)
+    funds = list(prices_history.columns)
+    if args.scenario:
+        try:
+            redistribution = np.array([parse_scenario(spec, funds) for spec in args.scenario])
+        except ValueError as error:
+            sys.exit(f'error: {error}')
+        labels = args.scenario
+    else:
+        # One scenario per fund: the whole balance moved into that fund
+        redistribution, labels = np.eye(len(funds)), funds
+    ranges = list(args.ranges) + [len(prices_history)]
+    df = find_what_if_redis(ranges, redistribution, current_balance, current_shares, prices_history)
+    df.index = pd.Index(labels, name='Redistribution')
+    print('"What-if" Redistribution Gains and Losses')
+    with pd.option_context('display.width', 200, 'display.max_columns', None):
+        print(df.round(2))
+    if args.plot:
+        from TSP_analysis import plot_what_if
+        plot_what_if(df)
+
+
+def seasonality(args):
+    import pandas as pd
+    from seasonality import monthly_loss_counts, seasonality_stats
+    prices_history = _load_prices(args)
+    if args.losses_only:
+        table = monthly_loss_counts(prices_history, args.funds, args.method)
+    else:
+        table = seasonality_stats(prices_history, args.period, args.funds, args.method)
+    with pd.option_context('display.width', 200, 'display.max_columns', None):
+        print(table.round(4))
+
+
+def import_files(args):
+    if args.source == 'activity':
+        from import_investment_activity import import_contributions
+        added = import_contributions(args.path, args.contributions)
+        print(f'Added {len(added)} contribution dates to {args.contributions}')
+    elif args.source == 'prices':
+        from share_prices import ingest_snapshot
+        added = ingest_snapshot(args.path, args.prices)
+        print(f'Added {len(added)} share price dates to {args.prices}')
+    else:
+        from import_investment_activity import TSPInterface
+        with TSPInterface() as tsp:
+            if args.source == 'scrape':
+                added = tsp.scrape_tsp_performance(args.prices)
+            else:
+                _, added = tsp.update_all(args.contributions, args.prices)
+                print(f'Imported the account activity into {args.contributions}')
+        print(f'Added {len(added)} share price dates to {args.prices}')
+
+
+def report(args):
+    from report import build_report
+    result = build_report(args.output_dir, args.formats, args.workers, force=args.force,
+                          contributions_path=args.contributions, prices_path=args.prices)
+    print(f"Wrote {len(result['written'])} artifacts, skipped {len(result['skipped'])} unchanged "
+          f"to {args.output_dir}")
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(description='Analyze a TSP account and the TSP share price history.')
+    parser.add_argument('--prices', default=join(RESOURCES, 'Share_Prices.csv'), help='share price CSV')
+    parser.add_argument('--contributions', default=join(RESOURCES, 'contributions.csv'), help='contributions CSV')
+    parser.add_argument('--instrument', metavar='LOG', default=None,
+                        help="log the wall time, rows and peak memory of each stage as JSON lines, '-' for stderr")
+    parser.add_argument('--profile', metavar='DIR', default=None, help='dump cProfile and tracemalloc results here')
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    command = commands.add_parser('summary', help='print the balance, gains and current holdings')
+    command.add_argument('--project-to', type=int, metavar='YEAR', default=None,
+                         help='also print the projected balance at the start of this year')
+    command.add_argument('--contribution', type=float, default=None,
+                         help='biweekly contribution for the projection, the last one by default')
+    command.add_argument('--paths', type=int, default=100_000, help='Monte Carlo paths of the projection')
+    command.set_defaults(run=summary)
+
+    command = commands.add_parser('plot', help='show or save the share price and account value figures')
+    command.add_argument('--figures', nargs='+', default=['share_prices_all_time', 'my_fund_value'],
+                         choices=['share_prices_all_time', 'share_prices_past_year', 'my_fund_value'])
+    command.add_argument('--save', metavar='DIR', default=None, help='write HTML files here instead of showing them')
+    command.add_argument('--point-budget', type=int, default=1000, help='points per line')
+    command.add_argument('--full-resolution-since', metavar='DATE', default=None,
+                         help='draw every share price from this date on, the past 52 weeks by default')
+    command.set_defaults(run=plot)
+
+    command = commands.add_parser('whatif', help='gains or losses of moving the balance to other allocations')
+    command.add_argument('--ranges', type=int, nargs='+', default=[15, 30, 280],
+                         help='look-back windows in trading days; all of the history is always included')
+    command.add_argument('--scenario', action='append', default=None,
+                         help="allocation like 'C FUND=0.6,F FUND=0.4'; repeat for more; one per fund by default")
+    command.add_argument('--plot', action='store_true', help='also show the bar chart')
+    command.set_defaults(run=whatif)
+
+    command = commands.add_parser('seasonality', help='return statistics per month, week or weekday')
+    command.add_argument('--period', choices=['month', 'week', 'weekday'], default='month')
+    command.add_argument('--method', choices=['period', 'daily'], default='period',
+                         help='whole-period returns or sums of daily returns')
+    command.add_argument('--funds', nargs='+', default=['C FUND', 'S FUND', 'I FUND', 'F FUND'])
+    command.add_argument('--losses-only', action='store_true', help='only count the losing years of each month')
+    command.set_defaults(run=seasonality)
+
+    command = commands.add_parser('import', help='add new contributions or share prices to the resource CSVs')
+    command.add_argument('source', choices=['activity', 'prices', 'scrape', 'account'],
+                         help='an InvestmentActivityDetail.csv, a saved share price page, the share prices scraped '
+                              'from tsp.gov, or both the prices and the account activity scraped from tsp.gov')
+    command.add_argument('path', nargs='?', default=None, help='file to import, for activity and prices')
+    command.set_defaults(run=import_files)
+
+    command = commands.add_parser('report', help='write all figures and tables to a directory')
+    command.add_argument('--output-dir', default='report')
+    command.add_argument('--formats', nargs='+', default=['html'], choices=['html', 'png'])
+    command.add_argument('--workers', type=int, default=None)
+    command.add_argument('--force', action='store_true', help='rewrite artifacts whose inputs have not changed')
+    command.set_defaults(run=report)
+    return parser
+
+
+def main(argv=None):
+    parser = build_parser()
+    args = parser.parse_args(argv)
+    if args.command == 'import' and args.source in ('activity', 'prices') and args.path is None:
+        parser.error(f'import {args.source} needs the path of the file to import')
+    if args.instrument:
+        from instrumentation import enable
+        enable(args.instrument)
+    if args.profile:
+        from instrumentation import profiled
+        with profiled(args.profile):
+            args.run(args)
+    else:
+        args.run(args)
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,105 @@
+"""
+csv_cache.py
+
+Binary cache for the dated CSV files in `resources` (share prices and contributions). The first read of a CSV parses
+it and stores its values as a NumPy array and its dates as an int64 array next to it in a `.cache` directory. Later
+reads memory-map those arrays instead of parsing the CSV, so warm starts skip CSV parsing and several processes share
+the same mapped pages. The cache is rebuilt whenever the size or modification time of the CSV changes.
+"""
+import json
+import os
+from os.path import basename, dirname, exists, join
+import numpy as np
+import pandas as pd
+
+from instrumentation import instrumented
+
+CACHE_VERSION = 1
+
+
+def _cache_paths(csv_path):
+    cache_dir = join(dirname(csv_path) or '.', '.cache')
+    stem = join(cache_dir, basename(csv_path))
+    return cache_dir, stem + '.json', stem + '.values.npy', stem + '.dates.npy'
+
+
+def _is_current(meta_path, stat, date_column):
+    if not exists(meta_path):
+        return False
+    try:
+        with open(meta_path) as f:
+            meta = json.load(f)
+    except (OSError, ValueError):
+        return False
+    return (meta.get('version') == CACHE_VERSION and meta.get('size') == stat.st_size and
+            meta.get('mtime_ns') == stat.st_mtime_ns and meta.get('date_column') == date_column)
+
+
+def _write_atomic(path, write):
+    tmp_path = f'{path}.{os.getpid()}.tmp'
+    with open(tmp_path, 'wb') as f:
+        write(f)
+    os.replace(tmp_path, path)
+
+
+def _parse(csv_path, date_column, date_format):
+    df = pd.read_csv(csv_path)
+    dates = pd.to_datetime(df.pop(date_column), format=date_format)
+    return dates, df.to_numpy(dtype=np.float64), list(df.columns)
+
+
+def _rebuild(csv_path, stat, date_column, date_format):
+    cache_dir, meta_path, values_path, dates_path = _cache_paths(csv_path)
+    os.makedirs(cache_dir, exist_ok=True)
+
+    dates, values, columns = _parse(csv_path, date_column, date_format)
+
+    # The metadata is written last, so a cache missing it (or with stale metadata) is never used
+    _write_atomic(values_path, lambda f: np.save(f, values))
+    _write_atomic(dates_path, lambda f: np.save(f, dates.to_numpy(dtype='datetime64[ns]').view(np.int64)))
+    meta = {'version': CACHE_VERSION, 'size': stat.st_size, 'mtime_ns': stat.st_mtime_ns,
+            'date_column': date_column, 'columns': columns}
+    _write_atomic(meta_path, lambda f: f.write(json.dumps(meta).encode()))
+
+
+@instrumented(rows=len)
+def read_dated_csv(csv_path, date_column='Date', date_format='%m/%d/%Y', cache=True):
+    """Read a CSV of one date column and numeric columns, through the binary cache.
+
+    Args:
+        csv_path: path to the CSV file
+        date_column: name of the date column, which becomes the index
+        date_format: strptime format of the dates in the CSV
+        cache: read through the binary cache; False parses the CSV without writing anything, for files read once
+
+    Returns:
+        DataFrame: float values indexed by date, in file order. Through the cache the values are a read-only memory
+            map of it, otherwise a writeable array.
+    """
+    if not cache:
+        dates, values, columns = _parse(csv_path, date_column, date_format)
+        return pd.DataFrame(values, index=pd.DatetimeIndex(dates, name=date_column), columns=columns, copy=False)
+    stat = os.stat(csv_path)
+    _, meta_path, values_path, dates_path = _cache_paths(csv_path)
+    if not _is_current(meta_path, stat, date_column):
+        _rebuild(csv_path, stat, date_column, date_format)
+
+    with open(meta_path) as f:
+        columns = json.load(f)['columns']
+    values = np.load(values_path, mmap_mode='r')
+    dates = np.load(dates_path, mmap_mode='r')
+    index = pd.DatetimeIndex(dates.view('datetime64[ns]'), name=date_column)
+    return pd.DataFrame(values, index=index, columns=columns, copy=False)
+
+
+def format_csv_dates(dates):
+    """Format dates the way the resource CSVs store them, e.g. 1/7/2021.
+
+    Args:
+        dates: DatetimeIndex or datetime Series
+
+    Returns:
+        Index of strings
+    """
+    dates = pd.DatetimeIndex(dates)
+    return dates.month.astype(str) + '/' + dates.day.astype(str) + '/' + dates.year.astype(str)
@@ -0,0 +1,236 @@
+"""
+history.py
+
+Compact array-backed containers for the share price and contribution histories. Dates are stored as int32 day numbers
+(days since 1970-01-01) sorted oldest first, values as one contiguous 2D array in a fixed fund order, and fund names
+in their canonical spelling, so the contributions file's 'G Fund' and the share price file's 'G FUND' name the same
+column. Values can be stored as float32, which together with the day numbers halves the memory of a loaded history.
+`to_frame` and friends wrap the arrays in pandas objects without copying the values. `AsOfIndex` looks up the prices in
+effect on any dates, e.g. contribution dates falling on weekends, in one vectorized pass.
+"""
+import numpy as np
+import pandas as pd
+
+from csv_cache import read_dated_csv
+from share_prices import canonical_fund_name
+
+DOLLAR_COLUMNS = ['Traditional', 'Roth', 'Automatic_1', 'Matching', 'Total']
+TRADING_DAYS_PER_YEAR = 252
+
+
+def to_day_numbers(dates):
+    """Day numbers (days since 1970-01-01) of dates, as int32."""
+    return pd.DatetimeIndex(dates).to_numpy(dtype='datetime64[D]').astype(np.int32)
+
+
+def to_dates(days, name='Date'):
+    """DatetimeIndex of day numbers."""
+    return pd.DatetimeIndex(np.asarray(days, dtype='datetime64[D]').astype('datetime64[ns]'), name=name)
+
+
+def clean_prices(prices):
+    """Share price history oldest first with one row per date, keeping the first row of each duplicated date, and NaN
+    in place of the price of 0 funds are stored with before they existed."""
+    prices = prices.sort_index(kind='stable')
+    prices = prices[~prices.index.duplicated(keep='first')]
+    return prices.where(prices > 0)
+
+
+def _sorted(dates, values, unique):
+    """Day numbers sorted oldest first and the matching C-contiguous rows of values."""
+    days = to_day_numbers(dates)
+    order = np.argsort(days, kind='stable')
+    if unique:
+        # Keep the first row of each duplicated date, as the rest of the analysis does
+        first = np.unique(days[order], return_index=True)[1]
+        order = order[first]
+    return np.ascontiguousarray(days[order]), np.ascontiguousarray(values[order])
+
+
+class PriceHistory:
+    """Share price history as contiguous arrays, oldest first.
+
+    Attributes:
+        days: int32 day number of each row
+        prices: rows x funds share prices, 0 where a fund did not exist yet
+        funds: canonical fund name of each column
+    """
+
+    def __init__(self, days, prices, funds):
+        self.days = np.ascontiguousarray(days, dtype=np.int32)
+        self.prices = np.ascontiguousarray(prices)
+        self.funds = [canonical_fund_name(fund) for fund in funds]
+        self._positions = {fund: i for i, fund in enumerate(self.funds)}
+        if self.prices.shape != (len(self.days), len(self.funds)):
+            raise ValueError(f'Prices of shape {self.prices.shape} do not match {len(self.days)} dates and '
+                             f'{len(self.funds)} funds')
+
+    @classmethod
+    def from_frame(cls, prices, dtype=np.float64):
+        """Build from a share price DataFrame indexed by date, in any date order.
+
+        Args:
+            prices: share price history, e.g. from `import_data`
+            dtype: np.float64, or np.float32 to halve the memory of the prices
+        """
+        days, values = _sorted(prices.index, prices.to_numpy(dtype=dtype), unique=True)
+        return cls(days, values, prices.columns)
+
+    @classmethod
+    def read_csv(cls, csv_path, dtype=np.float64):
+        """Read a share price CSV through the binary cache of `csv_cache`."""
+        return cls.from_frame(read_dated_csv(csv_path), dtype)
+
+    def __len__(self):
+        return len(self.days)
+
+    @property
+    def nbytes(self):
+        return self.days.nbytes + self.prices.nbytes
+
+    @property
+    def dates(self):
+        return to_dates(self.days)
+
+    def position(self, fund):
+        """Column of a fund, in any spelling."""
+        return self._positions[canonical_fund_name(fund)]
+
+    def column(self, fund):
+        """Prices of one fund, oldest first, as a view."""
+        return self.prices[:, self.position(fund)]
+
+    def latest(self):
+        """Prices on the newest date, as a view."""
+        return self.prices[-1]
+
+    def asof_index(self):
+        """`AsOfIndex` over these prices, sharing their arrays."""
+        return AsOfIndex(self.days, self.prices, self.funds)
+
+    def to_frame(self, newest_first=False):
+        """DataFrame view of the prices, oldest first or newest first like Share_Prices.csv, without copying them."""
+        if newest_first:
+            return pd.DataFrame(self.prices[::-1], index=self.dates[::-1], columns=self.funds, copy=False)
+        return pd.DataFrame(self.prices, index=self.dates, columns=self.funds, copy=False)
+
+
+class Contributions:
+    """Contribution history as contiguous arrays, oldest first.
+
+    Attributes:
+        days: int32 day number of each contribution
+        dollars: contributions x `DOLLAR_COLUMNS` dollar amounts
+        shares: contributions x funds shares bought (or sold when negative)
+        funds: canonical fund name of each column of `shares`
+    """
+
+    def __init__(self, days, dollars, shares, funds):
+        self.days = np.ascontiguousarray(days, dtype=np.int32)
+        self.dollars = np.ascontiguousarray(dollars)
+        self.shares = np.ascontiguousarray(shares)
+        self.funds = [canonical_fund_name(fund) for fund in funds]
+        if self.dollars.shape != (len(self.days), len(DOLLAR_COLUMNS)) or \
+                self.shares.shape != (len(self.days), len(self.funds)):
+            raise ValueError('Dollars and shares do not match the contribution dates and funds')
+
+    @classmethod
+    def from_frame(cls, contributions, funds=None, dtype=np.float64):
+        """Build from a contributions DataFrame with the `DOLLAR_COLUMNS` and one shares column per fund.
+
+        Args:
+            contributions: contributions history indexed by date, e.g. read from contributions.csv
+            funds: fund order to store the shares in, e.g. `PriceHistory.funds`; funds missing from the file get zero
+                shares. The file's own order by default.
+            dtype: np.float64 or np.float32
+        """
+        shares = contributions.drop(columns=DOLLAR_COLUMNS)
+        shares.columns = [canonical_fund_name(fund) for fund in shares.columns]
+        if funds is not None:
+            funds = [canonical_fund_name(fund) for fund in funds]
+            unknown = set(shares.columns) - set(funds)
+            if unknown:
+                raise ValueError(f"Contributions to unknown funds: {', '.join(sorted(unknown))}")
+            shares = shares.reindex(columns=funds, fill_value=0.0)
+        values = np.hstack([contributions[DOLLAR_COLUMNS].to_numpy(dtype=dtype), shares.to_numpy(dtype=dtype)])
+        days, values = _sorted(contributions.index, values, unique=False)
+        return cls(days, values[:, :len(DOLLAR_COLUMNS)], values[:, len(DOLLAR_COLUMNS):], shares.columns)
+
+    @classmethod
+    def read_csv(cls, csv_path, funds=None, dtype=np.float64, cache=True):
+        """Read a contributions CSV, through the binary cache of `csv_cache` unless `cache` is False."""
+        return cls.from_frame(read_dated_csv(csv_path, cache=cache), funds, dtype)
+
+    def __len__(self):
+        return len(self.days)
+
+    @property
+    def nbytes(self):
+        return self.days.nbytes + self.dollars.nbytes + self.shares.nbytes
+
+    @property
+    def dates(self):
+        return to_dates(self.days)
+
+    def current_shares(self):
+        """Total shares owned per fund."""
+        return self.shares.sum(axis=0)
+
+    def dollars_frame(self):
+        """DataFrame view of the dollar amounts, without copying them."""
+        return pd.DataFrame(self.dollars, index=self.dates, columns=DOLLAR_COLUMNS, copy=False)
+
+    def shares_frame(self):
+        """DataFrame view of the shares, without copying them."""
+        return pd.DataFrame(self.shares, index=self.dates, columns=self.funds, copy=False)
+
+
+class AsOfIndex:
+    """Sorted day numbers of a price history, for batched as-of lookups of the prices in effect on any dates.
+
+    The prices in effect on a date are those of the last trading day on or before it, so contributions made on
+    weekends or holidays are valued at the previous close. Every lookup is one `np.searchsorted` over all dates.
+
+    Args:
+        days: int32 day numbers of the price rows, sorted oldest first without duplicates
+        prices: rows x funds share prices
+        funds: fund name of each column
+    """
+
+    def __init__(self, days, prices, funds):
+        self.days = np.ascontiguousarray(days, dtype=np.int32)
+        self.prices = np.asarray(prices)
+        self.funds = list(funds)
+
+    @classmethod
+    def from_frame(cls, prices):
+        """Build from a share price DataFrame indexed by date, in any date order, keeping the first row of each date."""
+        days, values = _sorted(prices.index, prices.to_numpy(dtype=float), unique=True)
+        return cls(days, values, prices.columns)
+
+    def __len__(self):
+        return len(self.days)
+
+    def positions(self, dates):
+        """Row of the last trading day on or before each date, -1 for dates before the first price.
+
+        Args:
+            dates: DatetimeIndex, array of datetime64 or array of day numbers
+
+        Returns:
+            ndarray: one row of `prices` per date
+        """
+        dates = np.asarray(dates)
+        days = dates if np.issubdtype(dates.dtype, np.integer) else to_day_numbers(dates)
+        return np.searchsorted(self.days, days, side='right') - 1
+
+    def lookup(self, dates):
+        """Prices in effect on each date.
+
+        Returns:
+            ndarray: one row of fund prices per date, NaN for dates before the first price
+        """
+        rows = self.positions(dates)
+        values = self.prices[np.maximum(rows, 0)].astype(float)
+        values[rows < 0] = np.nan
+        return values
@@ -1,33 +1,94 @@
-from dotenv import load_dotenv
+from concurrent.futures import ThreadPoolExecutor
+from glob import glob
 import os
 from os.path import join
 import pandas as pd
-from selenium import webdriver
-from selenium.webdriver.common.by import By
-from selenium.webdriver.support import expected_conditions as EC
-from selenium.webdriver.support.ui import WebDriverWait
 import time
 
+from csv_cache import format_csv_dates, read_dated_csv
+from share_prices import canonical_fund_name, ingest_share_prices, parse_share_price_text
+
+# TSP activity types and the contributions.csv columns they are summed into
+ACTIVITY_COLUMNS = {'Traditional': 'Traditional', 'Roth': 'Roth', 'Automatic (1%)': 'Automatic_1', 'Match': 'Matching'}
+
+
+def chrome_driver(download_dir):
+    """Start Chrome, downloading files to `download_dir`
+
+    :param download_dir: Default download directory
+    :return: WebDriver
+    """
+    # Selenium is only needed for scraping, so importing this module for import_contributions stays cheap
+    from selenium import webdriver
+    chrome_options = webdriver.ChromeOptions()
+    chrome_options.add_experimental_option("prefs", {"download.default_directory": download_dir})
+    return webdriver.Chrome(options=chrome_options)
+
 
 class TSPInterface:
-    def __init__(self, download_dir=os.getcwd()):
+    """Scrapes tsp.gov through one browser session that stays open across operations.
+
+    The authenticated session logs in once and is reused by every later download. Public pages are loaded in a second
+    driver, so the share prices can be fetched while the activity download is in progress. Close the drivers with
+    `close`, or use the interface as a context manager.
+
+    :param download_dir: directory the browser downloads to
+    :param driver_factory: function of the download directory returning a new WebDriver, Chrome by default; pass
+        another to drive a headless browser or a fake driver
+    :param base_url: site to scrape, e.g. a local fake server in tests
+    :param timeout: seconds to wait for page elements and downloads
+    """
+
+    def __init__(self, download_dir=os.getcwd(), driver_factory=chrome_driver, base_url='https://www.tsp.gov',
+                 timeout=20):
         self.download_dir = download_dir
+        self.driver_factory = driver_factory
+        self.base_url = base_url.rstrip('/')
+        self.timeout = timeout
         self.driver = None
         self.wait = None
+        self.logged_in = False
+        self._public = None
 
-    @staticmethod
-    def load_driver(download_dir):
-        """Load TSP web page
+    def __enter__(self):
+        return self
 
-        :param download_dir: Default download directory
-        """
-        chrome_options = webdriver.ChromeOptions()
-        chrome_options.add_experimental_option("prefs", {"download.default_directory": download_dir})
-        driver = webdriver.Chrome(options=chrome_options)
-        return driver, WebDriverWait(driver, 20)
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+
+    def _new_session(self):
+        from selenium.webdriver.support.ui import WebDriverWait
+        driver = self.driver_factory(self.download_dir)
+        return driver, WebDriverWait(driver, self.timeout)
+
+    def session(self):
+        """The authenticated session's driver and wait, started on first use"""
+        if self.driver is None:
+            self.driver, self.wait = self._new_session()
+        return self.driver, self.wait
+
+    def public_session(self):
+        """The driver and wait for public pages, started on first use"""
+        if self._public is None:
+            self._public = self._new_session()
+        return self._public
+
+    def close(self):
+        """Quit all drivers; the next operation starts new ones"""
+        for driver in (self.driver, self._public[0] if self._public else None):
+            if driver is not None:
+                driver.quit()
+        self.driver, self.wait, self._public = None, None, None
+        self.logged_in = False
 
     def login(self):
-        """Log in to TSP"""
+        """Log in to TSP, once per session"""
+        if self.logged_in:
+            return
+        from dotenv import load_dotenv
+        from selenium.webdriver.common.by import By
+        from selenium.webdriver.support import expected_conditions as EC
+        driver, wait = self.session()
         # Load secret login strings
         load_dotenv()
         user = os.getenv("TSP_USER")
@@ -35,114 +96,174 @@ class TSPInterface:
         mfa_key = os.getenv("TSP_MFA")
 
         # Load login URL
-        url = 'https://www.tsp.gov/login/'
-        self.driver.get(url)
+        driver.get(f'{self.base_url}/login/')
 
         # Log in to TSP
-        self.wait.until(EC.element_to_be_clickable((By.XPATH, "//button[text()='Acknowledge']"))).click()
-        self.driver.find_element(by=By.NAME, value="username").send_keys(user)
-        self.driver.find_element(by=By.NAME, value="password").send_keys(password)
-        self.driver.find_element(by=By.ID, value="okta-signin-submit").click()
-        self.wait.until(EC.element_to_be_clickable((By.CLASS_NAME, "icon-dm"))).click()
-        self.driver.find_element(by=By.XPATH, value="//a[text()='Security Question']").click()
-        self.wait.until(EC.visibility_of_element_located((By.CLASS_NAME, "password-with-toggle")))
-        self.driver.find_element(by=By.CLASS_NAME, value="password-with-toggle").send_keys(mfa_key)
-        time.sleep(2)
-        self.wait.until(EC.element_to_be_clickable((By.XPATH, "//*[@class='button button-primary']"))).click()
-
-    def scrape_contributions(self):
-        """Download contributions CSV from the year to date"""
-        # Instantiate driver
-        self.driver, self.wait = self.load_driver(self.download_dir)
+        wait.until(EC.element_to_be_clickable((By.XPATH, "//button[text()='Acknowledge']"))).click()
+        driver.find_element(by=By.NAME, value="username").send_keys(user)
+        driver.find_element(by=By.NAME, value="password").send_keys(password)
+        driver.find_element(by=By.ID, value="okta-signin-submit").click()
+        wait.until(EC.element_to_be_clickable((By.CLASS_NAME, "icon-dm"))).click()
+        driver.find_element(by=By.XPATH, value="//a[text()='Security Question']").click()
+        wait.until(EC.visibility_of_element_located((By.CLASS_NAME, "password-with-toggle")))
+        driver.find_element(by=By.CLASS_NAME, value="password-with-toggle").send_keys(mfa_key)
+        wait.until(EC.element_to_be_clickable((By.XPATH, "//*[@class='button button-primary']"))).click()
+        self.logged_in = True
+
+    def downloads(self, pattern):
+        """Modification time and size of each file matching a glob pattern in the download directory
+
+        :param pattern: glob pattern of the file names, e.g. 'InvestmentActivityDetail*.csv'
+        :return: dict of path to (mtime_ns, size)
+        """
+        stats = {}
+        for path in glob(join(self.download_dir, pattern)):
+            try:
+                stat = os.stat(path)
+            except OSError:
+                continue
+            stats[path] = (stat.st_mtime_ns, stat.st_size)
+        return stats
+
+    def wait_for_download(self, pattern, before, timeout=None, poll=0.25):
+        """Wait until the browser has finished downloading a file
+
+        A file counts once it matches `pattern`, is new or changed since `before`, has no partial download
+        (.crdownload) next to it and is unchanged over two polls in a row.
+
+        :param pattern: glob pattern of the file name in the download directory, e.g. 'InvestmentActivityDetail*.csv'
+        :param before: `downloads(pattern)` from before the download started, so older downloads are ignored
+        :param timeout: seconds to wait, `self.timeout` by default
+        :param poll: seconds between checks
+        :return: path to the downloaded file
+        """
+        deadline = time.monotonic() + (self.timeout if timeout is None else timeout)
+        previous = {}
+        while True:
+            if not glob(join(self.download_dir, '*.crdownload')):
+                current = self.downloads(pattern)
+                for path, stat in current.items():
+                    if stat != before.get(path) and previous.get(path) == stat:
+                        return path
+                previous = current
+            if time.monotonic() > deadline:
+                raise TimeoutError(f'No completed download of {pattern} in {self.download_dir}')
+            time.sleep(poll)
 
+    def scrape_contributions(self, contributions_path=join('resources', 'contributions.csv')):
+        """Download contributions CSV from the year to date and merge it into the contributions file
+
+        :param contributions_path: personal contributions file to merge into
+        :return: path to the downloaded InvestmentActivityDetail.csv
+        """
+        from selenium.webdriver.common.by import By
+        from selenium.webdriver.support import expected_conditions as EC
         # Log in to TSP to get contributions
         self.login()
+        driver, wait = self.session()
 
         # Get contributions, waiting until page is fully loaded
         # The full XPATH is inconvenient, but so far is the only thing that I've found to work
         full_xpath = '/html/body/al-app/div[2]/app-page-host/div/al-primary-page/div/div/div/div/div[2]/div/worklife-' \
                      'home/div/div[1]/worklife-datacard-container-wc/div/div/worklife-datacard-retirementsavings-wc/' \
                      'worklife-datacard-template/section/div[4]/div[1]/div[2]/div[1]/div/a '
-        self.wait.until(EC.element_to_be_clickable((By.XPATH, full_xpath))).click()
+        wait.until(EC.element_to_be_clickable((By.XPATH, full_xpath))).click()
 
-        self.wait.until(EC.element_to_be_clickable((By.XPATH, "//a[text()='Account Activity']"))).click()
-        self.wait.until(EC.element_to_be_clickable((By.XPATH, "//span[text()='Download']"))).click()
-        self.wait.until(EC.element_to_be_clickable((By.XPATH, "//button[@title='Download']"))).click()
-        time.sleep(5)
+        wait.until(EC.element_to_be_clickable((By.XPATH, "//a[text()='Account Activity']"))).click()
+        wait.until(EC.element_to_be_clickable((By.XPATH, "//span[text()='Download']"))).click()
+        before = self.downloads('InvestmentActivityDetail*.csv')
+        wait.until(EC.element_to_be_clickable((By.XPATH, "//button[@title='Download']"))).click()
+        csv_path = self.wait_for_download('InvestmentActivityDetail*.csv', before)
 
         # Import contribution CSV
-        csv_path = os.path.join(self.download_dir, 'InvestmentActivityDetail.csv')
-        import_contributions(csv_path)
-        self.driver.close()
+        import_contributions(csv_path, contributions_path)
         return csv_path
 
-    def scrape_tsp_performance(self):
-        """Scrape public TSP fund performance and append to personal Share_Prices.csv file"""
-        # Instantiate driver
-        self.driver, self.wait = self.load_driver(self.download_dir)
+    def scrape_tsp_performance(self, csv_path=os.path.join('resources', 'Share_Prices.csv')):
+        """Scrape public TSP fund performance and add the new share prices to personal Share_Prices.csv file
 
-        # Load fund performance url
-        url = 'https://www.tsp.gov/share-price-history/'
-        self.driver.get(url)
+        :param csv_path: share price history file to update
+        :return: DataFrame of the share prices that were added, newest first
+        """
+        from selenium.webdriver.common.by import By
+        from selenium.webdriver.support import expected_conditions as EC
+        driver, wait = self.public_session()
 
-        old_prices = pd.read_csv(os.path.join('resources', 'Share_Prices.csv'))
+        # Load fund performance url
+        driver.get(f'{self.base_url}/share-price-history/')
 
         # TODO Made the input date based on the last gotten share price
-        # time.sleep(3)
         # self.driver.find_element(by=By.CLASS_NAME, value="date-range form-control input active").click()
         # self.driver.find_element(By.XPATH, "//input[@placeholder='Start Date..']").send_keys("2023-12-8")
         # self.driver.find_element(By.XPATH, "//*[@class='date-range form-control input']").click()#.send_keys("2023-12-8")
         # self.driver.find_element(by=By.ID, value="fundDateStart").click()#send_keys("2023-12-8")
         # self.driver.find_element(by=By.CLASS_NAME, value="usa-button").click()
 
-        price_table = self.driver.find_element(by=By.ID, value="dynamic-share-price-table")
+        price_table = wait.until(EC.presence_of_element_located((By.ID, "dynamic-share-price-table")))
+        return ingest_share_prices(parse_share_price_text(price_table.text), csv_path)
 
-        d = [i.split('$') for i in price_table.text.split('\n')]
-        cols = d[0][0][5:].split(' ')
-        cols = ['date'] + [(' ').join(cols[i:i + 2]) for i in range(0, len(cols), 2)]
-        df = pd.DataFrame(d[1:], columns=cols)
-        df['date'] = pd.to_datetime(df['date'])
-        for col in df.columns[1:]:
-            df[col] = df[col].astype('float')
+    def update_all(self, contributions_path=join('resources', 'contributions.csv'),
+                   prices_path=join('resources', 'Share_Prices.csv')):
+        """Fetch the public share prices while downloading and importing the account activity
 
-        # TODO add the updated prices and rewrite the table
+        :param contributions_path: personal contributions file to merge into
+        :param prices_path: share price history file to update
+        :return: path to the downloaded activity file and DataFrame of the share prices that were added
+        """
+        with ThreadPoolExecutor(max_workers=1) as executor:
+            prices = executor.submit(self.scrape_tsp_performance, prices_path)
+            activity_path = self.scrape_contributions(contributions_path)
+            return activity_path, prices.result()
 
-        df_to_add = df[df['date'] > old_prices.iloc(0)['date']]
 
-        self.driver.close()
+def import_contributions(tsp_investment_activity_path, contributions_path=join('resources', 'contributions.csv')):
+    """
+    Import InvestmentActivityDetail.csv file from TSP and merge its contribution activity into the personal
+    contributions.csv file
 
+    Activity is summed per valuation date in one pivot over the whole file. Dates already in the contributions file
+    are kept as they are, so importing the same download again does not change anything.
 
-def import_contributions(tsp_investment_activity_path):
+    :param tsp_investment_activity_path: path to InvestmentActivityDetail.csv
+    :param contributions_path: personal contributions file to merge into
+    :return: DataFrame of the contribution rows that were added
+    :raises ValueError: if the new activity buys or sells units of a fund missing from the contributions file
     """
-    Import InvestmentActivityDetail.csv file from TSP and personal contributions.csv file and append new
-    contribution activity
+    contrib_file = read_dated_csv(contributions_path)
+    fund_columns = contrib_file.columns.drop(list(ACTIVITY_COLUMNS.values()) + ['Total'])
 
-    :param tsp_investment_activity_path:
-    """
-    contrib_file = pd.read_csv(join('resources', 'contributions.csv'))
-    tsp_ia_file = pd.read_csv(tsp_investment_activity_path)
-    ia_df = pd.DataFrame(columns=contrib_file.columns)
-    for date, grp in tsp_ia_file.groupby('VALUATION DATE'):
-        ia_row = {'Date': grp.values[0][0].replace('-', '/'),
-                  'Traditional': grp[grp['ACTIVITY TYPE'] == 'Traditional']['AMOUNT'].sum(),
-                  'Roth': grp[grp['ACTIVITY TYPE'] == 'Roth']['AMOUNT'].sum(),
-                  'Automatic_1': grp[grp['ACTIVITY TYPE'] == 'Automatic (1%)']['AMOUNT'].sum(),
-                  'Matching': grp[grp['ACTIVITY TYPE'] == 'Match']['AMOUNT'].sum(),
-                  'Total': grp['AMOUNT'].sum()}
-        for fund in contrib_file.columns[6:]:
-            ia_row[fund] = grp[grp['FUND'] == fund]['FUND UNITS'].sum()
-        ia_df = ia_df.append(ia_row, ignore_index=True)
-        pass
-    ia_df = ia_df.fillna(0)
-
-    contrib_file2 = contrib_file.append(ia_df, ignore_index=True)
-    contrib_file2.to_csv(join('resources', 'contributions2.csv'), index=False)
-    pass
+    activity = pd.read_csv(tsp_investment_activity_path,
+                           usecols=['VALUATION DATE', 'ACTIVITY TYPE', 'FUND', 'AMOUNT', 'FUND UNITS'])
+    activity['Date'] = pd.to_datetime(activity['VALUATION DATE'].str.replace('-', '/'), format='%m/%d/%Y')
+    activity['FUND'] = activity['FUND'].map(canonical_fund_name)
 
+    dollars = activity.pivot_table(index='Date', columns='ACTIVITY TYPE', values='AMOUNT', aggfunc='sum')
+    dollars = dollars.reindex(columns=list(ACTIVITY_COLUMNS)).rename(columns=ACTIVITY_COLUMNS)
+    dollars['Total'] = activity.groupby('Date')['AMOUNT'].sum()
+    units = activity.pivot_table(index='Date', columns='FUND', values='FUND UNITS', aggfunc='sum')
+    # Units of funds without a column would be dropped while their dollars stay in the Total
+    new_units = units[~units.index.isin(contrib_file.index)]
+    known = {canonical_fund_name(fund) for fund in fund_columns}
+    unknown = [fund for fund in new_units.columns if fund not in known and new_units[fund].fillna(0).any()]
+    if unknown:
+        raise ValueError(f"Contributions to unknown funds: {', '.join(sorted(unknown))}")
+    units = units.reindex(columns=[canonical_fund_name(fund) for fund in fund_columns])
+    units.columns = fund_columns
+    ia_df = dollars.join(units)[contrib_file.columns].fillna(0)
 
-if __name__ == '__main__':
-    tspi = TSPInterface()
-    # iad_path = tspi.scrape_contributions()
-    # import_contributions(iad_path)
+    ia_df = ia_df[~ia_df.index.isin(contrib_file.index)]
+    if ia_df.empty:
+        return ia_df
+
+    merged = pd.concat([contrib_file, ia_df]).sort_index(kind='stable')
+    merged.index = format_csv_dates(merged.index).rename('Date')
+    tmp_path = f'{contributions_path}.{os.getpid()}.tmp'
+    merged.to_csv(tmp_path, float_format='%.10g')
+    os.replace(tmp_path, contributions_path)
+    return ia_df
 
-    tspi.scrape_tsp_performance()
+
+if __name__ == '__main__':
+    with TSPInterface() as tspi:
+        # iad_path, new_prices = tspi.update_all()
+        tspi.scrape_tsp_performance()
@@ -0,0 +1,199 @@
+"""
+instrumentation.py
+
+Opt-in instrumentation of the analysis stages. Functions decorated with `instrumented`, and blocks wrapped in `stage`,
+record their wall time, the rows they processed and, optionally, the peak memory they allocated, as one JSON object per
+line written to a log file or stderr. It is off by default, when a decorated function costs one extra attribute check.
+
+Enable it with `enable()`, or for a whole run, including worker processes, with the environment variable
+TSP_INSTRUMENT set to a log file path or '-' for stderr (TSP_INSTRUMENT_MEMORY=0 skips the memory tracking):
+    TSP_INSTRUMENT=stages.jsonl python report.py
+
+`profiled` wraps a run in cProfile and tracemalloc and dumps both for a closer look.
+"""
+from contextlib import contextmanager
+import cProfile
+import functools
+import json
+import os
+import pstats
+import sys
+import time
+import tracemalloc
+
+ENV_LOG = 'TSP_INSTRUMENT'
+ENV_MEMORY = 'TSP_INSTRUMENT_MEMORY'
+
+
+class _State:
+    enabled = False
+    memory = False
+    log_path = None
+    stack = []
+    records = []
+
+
+def enable(log_path='-', memory=True):
+    """Start recording stages.
+
+    Args:
+        log_path: JSON lines file the records are appended to, '-' for stderr, or None to keep them in memory instead
+            (see `records`)
+        memory: also track the peak memory of each stage with tracemalloc, which slows allocations down
+    """
+    _State.enabled, _State.memory, _State.log_path = True, memory, log_path
+    if memory and not tracemalloc.is_tracing():
+        tracemalloc.start()
+    # Worker processes started from here enable themselves on import
+    if log_path is not None:
+        os.environ[ENV_LOG] = log_path
+        os.environ[ENV_MEMORY] = '1' if memory else '0'
+
+
+def disable():
+    """Stop recording stages."""
+    _State.enabled = False
+    os.environ.pop(ENV_LOG, None)
+    os.environ.pop(ENV_MEMORY, None)
+    if _State.memory and tracemalloc.is_tracing():
+        tracemalloc.stop()
+
+
+def records():
+    """Records of the stages finished in this process while enabled without a log, oldest first.
+
+    Records written to a log are not kept, so a long batch run does not grow with the number of stages it records.
+    """
+    return list(_State.records)
+
+
+def _emit(record):
+    if _State.log_path is None:
+        _State.records.append(record)
+        return
+    line = json.dumps(record) + '\n'
+    if _State.log_path == '-':
+        sys.stderr.write(line)
+    else:
+        with open(_State.log_path, 'a') as f:
+            f.write(line)
+
+
+class _Stage:
+    """Measures one stage; the value bound by `with stage(...) as s` takes more details with `s.rows = n`."""
+
+    def __init__(self, name, rows=None, **details):
+        self.name = name
+        self.rows = rows
+        self.details = details
+        self.peak = 0
+
+    def __enter__(self):
+        if _State.memory:
+            peak = tracemalloc.get_traced_memory()[1]
+            if _State.stack:
+                _State.stack[-1].peak = max(_State.stack[-1].peak, peak)
+            tracemalloc.reset_peak()
+            self.start_memory = tracemalloc.get_traced_memory()[0]
+        self.parent = _State.stack[-1].name if _State.stack else None
+        _State.stack.append(self)
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        wall = time.perf_counter() - self.start
+        _State.stack.pop()
+        record = {'stage': self.name, 'wall_s': round(wall, 6), 'rows': self.rows, 'parent': self.parent,
+                  'pid': os.getpid(), 'time': time.time()}
+        if _State.memory:
+            self.peak = max(self.peak, tracemalloc.get_traced_memory()[1])
+            if _State.stack:
+                _State.stack[-1].peak = max(_State.stack[-1].peak, self.peak)
+            record['peak_bytes'] = self.peak - self.start_memory
+        if exc_type is not None:
+            record['error'] = exc_type.__name__
+        record.update(self.details)
+        _emit(record)
+        return False
+
+
+class _NullStage:
+    rows = None
+
+    def __setattr__(self, name, value):
+        pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        return False
+
+
+_NULL_STAGE = _NullStage()
+
+
+def stage(name, rows=None, **details):
+    """Context manager recording a block as a stage, or doing nothing when instrumentation is off.
+
+    Args:
+        name: stage name
+        rows: rows processed, if known up front
+        **details: other JSON values to record
+    """
+    return _Stage(name, rows, **details) if _State.enabled else _NULL_STAGE
+
+
+def instrumented(name=None, rows=None):
+    """Decorator recording every call of a function as a stage.
+
+    Args:
+        name: stage name, the function name by default
+        rows: function of the call's result giving the rows processed, e.g. `len`
+    """
+    def decorate(function):
+        stage_name = name or function.__name__
+
+        @functools.wraps(function)
+        def wrapper(*args, **kwargs):
+            if not _State.enabled:
+                return function(*args, **kwargs)
+            with _Stage(stage_name) as current:
+                result = function(*args, **kwargs)
+                if rows is not None:
+                    current.rows = rows(result)
+            return result
+        return wrapper
+    return decorate
+
+
+@contextmanager
+def profiled(output_dir, top=30):
+    """Profile the enclosed block with cProfile and tracemalloc and dump the results to a directory.
+
+    Writes `profile.prof` (load with pstats or snakeviz), `profile.txt` with the `top` functions by cumulative time and
+    `allocations.txt` with the `top` source lines by allocated memory still held at the end of the block.
+    """
+    os.makedirs(output_dir, exist_ok=True)
+    started_tracing = not tracemalloc.is_tracing()
+    if started_tracing:
+        tracemalloc.start(25)
+    profiler = cProfile.Profile()
+    profiler.enable()
+    try:
+        yield
+    finally:
+        profiler.disable()
+        snapshot = tracemalloc.take_snapshot()
+        if started_tracing:
+            tracemalloc.stop()
+        profiler.dump_stats(os.path.join(output_dir, 'profile.prof'))
+        with open(os.path.join(output_dir, 'profile.txt'), 'w') as f:
+            pstats.Stats(profiler, stream=f).sort_stats('cumulative').print_stats(top)
+        with open(os.path.join(output_dir, 'allocations.txt'), 'w') as f:
+            for statistic in snapshot.statistics('lineno')[:top]:
+                f.write(f'{statistic}\n')
+
+
+if os.environ.get(ENV_LOG):
+    enable(os.environ[ENV_LOG], os.environ.get(ENV_MEMORY, '1') != '0')
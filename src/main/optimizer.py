@@ -0,0 +1,144 @@
+"""
+optimizer.py
+
+Searches the fund simplex (all ways to split the balance between funds) for the best allocation under a chosen
+objective: the what-if gain of `calculate_futures`, the Sharpe ratio or the maximum drawdown. The search starts on a
+coarse grid over the whole simplex and then refines the best allocations by moving weight between pairs of funds in
+ever smaller steps, down to 1%. Every step scores its candidates as one batch from return statistics computed once.
+"""
+import numpy as np
+import pandas as pd
+
+from history import TRADING_DAYS_PER_YEAR, clean_prices
+from instrumentation import instrumented
+from scenarios import score_redistributions
+
+CORE_FUNDS = ['G FUND', 'F FUND', 'C FUND', 'S FUND', 'I FUND']
+RISK_FREE_FUND = 'G FUND'
+OBJECTIVES = ['gain', 'sharpe', 'drawdown']
+
+
+def simplex_grid(n_funds, units, caps):
+    """All ways to split `units` equal parts between `n_funds` funds, with at most `caps[i]` parts in fund i.
+
+    Returns:
+        ndarray: one row of integer parts per allocation
+    """
+    if n_funds == 1:
+        return np.array([[units]]) if units <= caps[0] else np.empty((0, 1), dtype=int)
+    rows = []
+    for first in range(min(units, caps[0]) + 1):
+        rest = simplex_grid(n_funds - 1, units - first, caps[1:])
+        rows.append(np.column_stack([np.full(len(rest), first), rest]))
+    return np.concatenate(rows)
+
+
+class _Objective:
+    """Scores batches of allocations over a fixed set of funds; higher is better for every objective."""
+
+    def __init__(self, objective, history, funds, current_shares, days):
+        if objective not in OBJECTIVES:
+            raise ValueError(f"Unknown objective '{objective}', expected one of {', '.join(OBJECTIVES)}")
+        self.objective = objective
+        self.history = history
+        self.positions = [history.columns.get_loc(fund) for fund in funds]
+        self.current_shares = current_shares
+        self.current_balance = float(np.nansum(np.asarray(current_shares) * history.iloc[0].to_numpy()))
+        self.days = days
+
+        # Return statistics over the days all candidate funds have prices; 0 means the fund did not exist yet.
+        # The Sharpe ratio is measured over the G Fund, the risk-free choice within the TSP.
+        risk_free = RISK_FREE_FUND if RISK_FREE_FUND in history.columns else None
+        prices = clean_prices(history[funds + ([risk_free] if risk_free else [])]).dropna().to_numpy()
+        returns = prices[1:] / prices[:-1] - 1
+        self.returns = returns[:, :len(funds)]
+        excess = self.returns - (returns[:, -1:] if risk_free else 0)
+        self.mean = excess.mean(axis=0)
+        self.cov = np.cov(excess, rowvar=False).reshape(len(funds), len(funds))
+
+    def __call__(self, weights, chunk_size=2_000):
+        if self.objective == 'gain':
+            redistribution = np.zeros((len(weights), self.history.shape[1]))
+            redistribution[:, self.positions] = weights
+            return score_redistributions(redistribution, [self.days], self.current_balance, self.current_shares,
+                                         self.history)[:, 0]
+        if self.objective == 'sharpe':
+            variance = np.einsum('ij,jk,ik->i', weights, self.cov, weights)
+            with np.errstate(divide='ignore', invalid='ignore'):
+                sharpe = weights @ self.mean / np.sqrt(variance) * np.sqrt(TRADING_DAYS_PER_YEAR)
+            return np.nan_to_num(sharpe, nan=-np.inf)
+        scores = []
+        for start in range(0, len(weights), chunk_size):
+            value = np.cumprod(1 + self.returns @ weights[start:start + chunk_size].T, axis=0)
+            scores.append((value / np.maximum.accumulate(value, axis=0) - 1).min(axis=0))
+        return np.concatenate(scores)
+
+
+def _neighbours(allocations, step_units, caps):
+    """Allocations reached by moving `step_units` parts from one fund to another, within the caps."""
+    n_funds = allocations.shape[1]
+    moves = np.array([np.eye(n_funds, dtype=int)[j] - np.eye(n_funds, dtype=int)[i]
+                      for i in range(n_funds) for j in range(n_funds) if i != j]) * step_units
+    candidates = (allocations[:, None, :] + moves[None, :, :]).reshape(-1, n_funds)
+    valid = (candidates >= 0).all(axis=1) & (candidates <= caps).all(axis=1)
+    return np.unique(candidates[valid], axis=0)
+
+
+@instrumented()
+def optimize_allocation(history, current_shares, objective='sharpe', funds=None, max_weight=1.0, days=None,
+                        coarse_step=0.1, steps=(0.05, 0.02, 0.01), keep=5):
+    """Find the best allocation of the balance between funds.
+
+    The 'sharpe' and 'drawdown' objectives are measured over the days on which every allowed fund (and the G Fund) has a
+    price, so allowing a recent fund such as a new L fund limits them to the years since it started. The coarse grid
+    grows quickly with the number of funds, about 2 million allocations for all 15 at a 10% step.
+
+    Args:
+        history: share price history, as returned by `import_data`
+        current_shares: current amount of shares owned per fund, as returned by `import_data`
+        objective: 'gain' for the what-if gain over `days` (see `calculate_futures`), 'sharpe' for the annualized
+            Sharpe ratio of daily returns in excess of the G Fund, or 'drawdown' for the smallest maximum drawdown
+        funds: funds allowed in the allocation, the `CORE_FUNDS` in history by default
+        max_weight: largest fraction of the balance in any one fund, or a dict of fraction per fund
+        days: look-back window in trading days for the 'gain' objective, all of the history by default
+        coarse_step: fraction step of the initial grid over the whole simplex
+        steps: fraction steps of the following refinements, the last one being the final granularity
+        keep: number of best allocations refined at each step
+
+    Returns:
+        Series: best fraction of the balance per fund, over all columns of `history`
+        float: objective score of that allocation
+    """
+    funds = [fund for fund in CORE_FUNDS if fund in history.columns] if funds is None else list(funds)
+    resolution = int(round(1 / min((coarse_step,) + tuple(steps))))
+    if isinstance(max_weight, dict):
+        caps = np.array([int(np.floor(max_weight.get(fund, 1.0) * resolution + 1e-9)) for fund in funds])
+    else:
+        caps = np.full(len(funds), int(np.floor(max_weight * resolution + 1e-9)))
+    if caps.sum() < resolution:
+        raise ValueError('The weight limits do not allow allocating the whole balance')
+    score = _Objective(objective, history, funds, current_shares, len(history) if days is None else days)
+
+    coarse_units = int(round(1 / coarse_step))
+    scale = resolution // coarse_units
+    candidates = simplex_grid(len(funds), coarse_units, caps // scale) * scale
+    if len(candidates) == 0:
+        # The caps are finer than the coarse grid; start from filling the funds in order instead
+        candidates = np.diff(np.minimum(np.cumsum(np.concatenate([[0], caps])), resolution))[None, :]
+    scores = score(candidates / resolution)
+    order = np.argsort(scores)[::-1][:keep]
+    best, best_scores = candidates[order], scores[order]
+
+    for step in steps:
+        step_units = int(round(step * resolution))
+        while True:
+            candidates = np.unique(np.concatenate([best, _neighbours(best, step_units, caps)]), axis=0)
+            scores = score(candidates / resolution)
+            order = np.argsort(scores)[::-1][:keep]
+            if scores[order].sum() <= best_scores.sum():
+                break
+            best, best_scores = candidates[order], scores[order]
+
+    weights = pd.Series(0.0, index=history.columns)
+    weights[funds] = best[0] / resolution
+    return weights, float(best_scores[0])
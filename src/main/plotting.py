@@ -0,0 +1,110 @@
+"""
+plotting.py
+
+Shared rendering layer for the Plotly figures: one cached figure template with the styling every plot uses, and line
+traces decimated with largest-triangle-three-buckets (LTTB) to a point budget, switching to WebGL (Scattergl) when a
+trace still has many points. The size of the HTML output and the render time then stay flat as the history grows.
+Plotly is only imported once a figure is built, so importing this module for its constants stays cheap.
+"""
+from functools import lru_cache
+import numpy as np
+import pandas as pd
+
+POINT_BUDGET = 1000
+WEBGL_THRESHOLD = 2000
+COLORS = ['royalblue', 'crimson', 'mediumseagreen', 'mediumpurple', 'darkorange', 'turquoise', 'deeppink', 'gold',
+          'lawngreen', 'sienna']
+
+_AXIS = dict(showline=True, mirror=True, linewidth=1, linecolor='black',
+             zeroline=True, zerolinewidth=1, zerolinecolor='lightgrey',
+             showgrid=True, gridwidth=1, gridcolor='lightgrey')
+
+
+@lru_cache(maxsize=None)
+def figure_template():
+    """Plotly template with the axis, legend, font and margin styling shared by all plots."""
+    import plotly.graph_objects as go
+    return go.layout.Template(layout=dict(
+        xaxis=_AXIS, yaxis=_AXIS,
+        legend=dict(orientation="h", yanchor="bottom", y=-0.2, xanchor="center", x=0.5),
+        font=dict(family='Times New Roman', size=15), plot_bgcolor='rgba(0,0,0,0)',
+        margin=dict(l=20, r=20, t=20, b=20)))
+
+
+def lttb(x, y, n_out):
+    """Indices of the points kept by largest-triangle-three-buckets downsampling.
+
+    The first and last points are always kept. The points in between are split into `n_out - 2` buckets and each
+    bucket keeps the point forming the largest triangle with the point kept in the previous bucket and the average of
+    the next bucket, which preserves the visual shape of the line.
+
+    Args:
+        x: sorted numeric x values
+        y: y values
+        n_out: number of points to keep
+
+    Returns:
+        ndarray: sorted indices of the kept points
+    """
+    n = len(x)
+    if n_out >= n or n_out < 3:
+        return np.arange(n)
+    edges = np.linspace(1, n - 1, n_out - 1).astype(int)
+    edges = np.append(edges, n)
+    selected = np.empty(n_out, dtype=int)
+    selected[0], selected[-1] = 0, n - 1
+    previous = 0
+    for bucket in range(n_out - 2):
+        start, end = edges[bucket], edges[bucket + 1]
+        next_x = x[end:edges[bucket + 2]].mean()
+        next_y = y[end:edges[bucket + 2]].mean()
+        area = np.abs((x[previous] - next_x) * (y[start:end] - y[previous]) -
+                      (x[previous] - x[start:end]) * (next_y - y[previous]))
+        previous = start + int(np.argmax(area))
+        selected[bucket + 1] = previous
+    return selected
+
+
+def decimate(x, y, point_budget=POINT_BUDGET, full_resolution_since=None):
+    """Downsample a line to about `point_budget` points, keeping every point from `full_resolution_since` on.
+
+    Args:
+        x: DatetimeIndex or numeric x values, in any order
+        y: y values
+        point_budget: number of points to keep before `full_resolution_since`
+        full_resolution_since: x value from which all points are kept, e.g. the start of the range shown zoomed in
+
+    Returns:
+        x and y of the kept points, sorted by x
+    """
+    x, y = pd.Index(x), np.asarray(y, dtype=float)
+    order = np.argsort(x.to_numpy(), kind='stable')
+    x, y = x[order], y[order]
+    keep = ~np.isnan(y)
+    x, y = x[keep], y[keep]
+
+    split = len(x) if full_resolution_since is None else int(x.searchsorted(full_resolution_since))
+    numeric = x.to_numpy()[:split].astype('int64' if isinstance(x, pd.DatetimeIndex) else float).astype(float)
+    kept = np.concatenate([lttb(numeric, y[:split], point_budget), np.arange(split, len(x))])
+    return x[kept], y[kept]
+
+
+def line_trace(x, y, name, point_budget=POINT_BUDGET, full_resolution_since=None, mode='lines', **kwargs):
+    """Decimated line trace, drawn with WebGL when it still has more than `WEBGL_THRESHOLD` points.
+
+    Args:
+        x: x values
+        y: y values
+        name: trace name
+        point_budget: see `decimate`
+        full_resolution_since: see `decimate`
+        mode: Plotly scatter mode
+        **kwargs: other Scatter properties, e.g. line
+
+    Returns:
+        go.Scatter or go.Scattergl
+    """
+    import plotly.graph_objects as go
+    x, y = decimate(x, y, point_budget, full_resolution_since)
+    trace = go.Scattergl if len(x) > WEBGL_THRESHOLD else go.Scatter
+    return trace(x=x, y=y, name=name, mode=mode, **kwargs)
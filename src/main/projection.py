@@ -0,0 +1,110 @@
+"""
+projection.py
+
+Monte Carlo projection of the account balance. Historical daily returns of the current allocation are block-resampled
+(moving block bootstrap, which keeps the short-term autocorrelation and volatility clustering of real markets) into
+many simulated futures, with the regular contributions added along the way. Paths are simulated in chunks of a bounded
+size, each with its own seed derived from one master seed, so results are reproducible for any number of workers.
+"""
+from concurrent.futures import ProcessPoolExecutor
+import datetime
+import numpy as np
+import pandas as pd
+
+from history import clean_prices
+from instrumentation import instrumented
+
+PERCENTILES = (5, 25, 50, 75, 95)
+
+
+def portfolio_returns(prices, weights):
+    """Daily returns of a portfolio rebalanced to fixed weights, over the days all weighted funds have prices.
+
+    Args:
+        prices: share price history, in any date order
+        weights: fraction of the portfolio in each fund, one entry per price column
+
+    Returns:
+        ndarray: daily portfolio returns, oldest first
+    """
+    weights = np.asarray(weights, dtype=float)
+    held = weights != 0
+    prices = clean_prices(prices.loc[:, held]).dropna()
+    returns = prices.to_numpy()[1:] / prices.to_numpy()[:-1] - 1
+    return returns @ (weights[held] / weights[held].sum())
+
+
+def _simulate_chunk(returns, n_paths, n_days, block_size, start_balance, contribution, contribution_every,
+                    checkpoint_days, seed):
+    """Simulate one chunk of paths and return their balances at the checkpoint days as float32."""
+    rng = np.random.default_rng(seed)
+    n_blocks = -(-n_days // block_size)
+    starts = rng.integers(0, len(returns) - block_size + 1, size=(n_paths, n_blocks))
+    balances = np.empty((n_paths, len(checkpoint_days)), dtype=np.float32)
+    balance = np.full(n_paths, float(start_balance))
+
+    day = 0
+    for block in range(n_blocks):
+        length = min(block_size, n_days - day)
+        growth = np.cumprod(1 + returns[starts[:, block, None] + np.arange(length)], axis=1)
+        days = day + 1 + np.arange(length)
+        contributions = np.where(days % contribution_every == 0, contribution, 0.0)
+        # Balance after each day, with each contribution invested at that day's close:
+        # V_t = G_t * (V_0 + sum_{k <= t} c_k / G_k), G being the cumulative growth within the block
+        path = growth * (balance[:, None] + np.cumsum(contributions / growth, axis=1))
+
+        in_block = (checkpoint_days > day) & (checkpoint_days <= day + length)
+        balances[:, in_block] = path[:, checkpoint_days[in_block] - day - 1]
+        balance = path[:, -1]
+        day += length
+    return balances
+
+
+@instrumented(rows=len)
+def project_balance(prices, weights, start_balance, contribution, target_date, n_paths=100_000, block_size=20,
+                    contribution_every=10, chunk_size=10_000, n_checkpoints=24, percentiles=PERCENTILES, seed=None,
+                    workers=1, start_date=None):
+    """Percentile bands of the projected balance from now until a target date.
+
+    Args:
+        prices: share price history
+        weights: current fraction of the balance in each fund, one entry per price column
+        start_balance: current balance
+        contribution: dollars added every `contribution_every` trading days
+        target_date: date to project to
+        n_paths: number of simulated paths
+        block_size: length in trading days of each resampled block of historical returns
+        contribution_every: trading days between contributions, 10 for biweekly pay periods
+        chunk_size: paths simulated at once, bounding memory to about chunk_size x block_size values
+        n_checkpoints: number of dates, evenly spaced up to the target date, to report bands for
+        percentiles: percentiles to report
+        seed: seed for reproducible runs
+        workers: number of processes to simulate chunks in
+        start_date: date the projection starts, today by default
+
+    Returns:
+        DataFrame: balance percentiles (columns) at each checkpoint business day (index), ending at `target_date`
+    """
+    start_date = pd.Timestamp(start_date or datetime.date.today()).normalize()
+    target_date = pd.Timestamp(target_date).normalize()
+    n_days = int(np.busday_count(start_date.date(), target_date.date()))
+    if n_days <= 0:
+        raise ValueError('Target date must be at least one business day after the start date')
+
+    returns = portfolio_returns(prices, weights)
+    block_size = min(block_size, len(returns))
+    checkpoint_days = np.unique(np.linspace(0, n_days, n_checkpoints + 1)[1:].round().astype(int))
+
+    chunks = [min(chunk_size, n_paths - start) for start in range(0, n_paths, chunk_size)]
+    seeds = np.random.SeedSequence(seed).spawn(len(chunks))
+    args = [(returns, size, n_days, block_size, start_balance, contribution, contribution_every, checkpoint_days,
+             chunk_seed) for size, chunk_seed in zip(chunks, seeds)]
+    if workers > 1:
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            balances = list(executor.map(_simulate_chunk, *zip(*args)))
+    else:
+        balances = [_simulate_chunk(*chunk_args) for chunk_args in args]
+
+    bands = np.percentile(np.concatenate(balances), percentiles, axis=0).T
+    dates = pd.DatetimeIndex(np.busday_offset(start_date.date(), checkpoint_days, roll='forward'), name='Date')
+    return pd.DataFrame(bands, index=dates, columns=[f'{p}%' for p in percentiles])
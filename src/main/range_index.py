@@ -0,0 +1,139 @@
+"""
+range_index.py
+
+Sparse table over the share price history answering "highest/lowest price of a fund over a span of days" in
+constant time. The table is built once from the dataframe returned by `import_data` and can be extended in place when
+newer daily prices are prepended to the history.
+"""
+import numpy as np
+import pandas as pd
+
+
+class PriceRangeIndex:
+    """Range maximum/minimum index over a share price history.
+
+    Rows are stored oldest first so that new prices are appended at the end of every level of the table. Missing
+    prices, blank or stored as 0 before a fund existed, are ignored, so a fund that did not exist yet over part of a
+    span takes its extreme over the rest of it.
+    """
+
+    def __init__(self, prices_history):
+        """Build the index.
+
+        Args:
+            prices_history: share price history as returned by `import_data`, newest first
+        """
+        history = prices_history.sort_index()
+        self.funds = list(history.columns)
+        self._fund_position = {fund: i for i, fund in enumerate(self.funds)}
+        self._days = np.empty(0, dtype='datetime64[D]')
+        self._length = 0
+        self._max = np.empty((1, 0, len(self.funds)))
+        self._min = np.empty((1, 0, len(self.funds)))
+        self._append(history.index.values.astype('datetime64[D]'), self._prices(history))
+
+    def __len__(self):
+        return self._length
+
+    @property
+    def newest_date(self):
+        """Date of the most recent price in the index."""
+        return pd.Timestamp(self._days[self._length - 1])
+
+    def prepend(self, new_prices):
+        """Add prices newer than everything already indexed.
+
+        Only the table entries whose span reaches the new rows are computed, so adding a day costs
+        O(log(days) * funds).
+
+        Args:
+            new_prices: dataframe of new share prices with the same fund columns, in any date order
+        """
+        new_prices = new_prices.sort_index()[self.funds]
+        if len(new_prices) == 0:
+            return
+        if self._length and new_prices.index[0] <= self.newest_date:
+            raise ValueError(f'New prices must be after {self.newest_date:%m/%d/%Y}, got {new_prices.index[0]:%m/%d/%Y}')
+        self._append(new_prices.index.values.astype('datetime64[D]'), self._prices(new_prices))
+
+    @staticmethod
+    def _prices(history):
+        values = history.to_numpy(dtype=float)
+        return np.where(values > 0, values, np.nan)
+
+    def _append(self, days, values):
+        old_length = self._length
+        self._length += len(values)
+        self._reserve(self._length)
+        self._days[old_length:self._length] = days
+        self._max[0, old_length:self._length] = values
+        self._min[0, old_length:self._length] = values
+
+        for level in range(1, self._max.shape[0]):
+            half = 1 << (level - 1)
+            stop = self._length - 2 * half + 1
+            if stop <= 0:
+                break
+            start = max(old_length - 2 * half + 1, 0)
+            np.fmax(self._max[level - 1, start:stop], self._max[level - 1, start + half:stop + half],
+                    out=self._max[level, start:stop])
+            np.fmin(self._min[level - 1, start:stop], self._min[level - 1, start + half:stop + half],
+                    out=self._min[level, start:stop])
+
+    def _reserve(self, length):
+        """Grow the storage geometrically so that repeated small prepends stay amortized O(1) in copying."""
+        capacity = self._max.shape[1]
+        if length <= capacity:
+            return
+        capacity = max(length, 2 * capacity)
+        levels = capacity.bit_length()
+        days = np.empty(capacity, dtype='datetime64[D]')
+        days[:len(self._days)] = self._days
+        self._days = days
+        for name in ('_max', '_min'):
+            table = np.full((levels, capacity, len(self.funds)), np.nan)
+            old = getattr(self, name)
+            table[:old.shape[0], :old.shape[1]] = old
+            setattr(self, name, table)
+
+    def _query(self, table, combine, start, stop, fund):
+        """Extreme of rows [start, stop) in oldest-first order, for one fund or all funds."""
+        start, stop = max(int(start), 0), min(int(stop), self._length)
+        if stop <= start:
+            raise ValueError('Empty price range')
+        level = (stop - start).bit_length() - 1
+        row = combine(table[level, start], table[level, stop - (1 << level)])
+        return row if fund is None else row[self._fund_position[fund]]
+
+    def _date_bounds(self, start_date, end_date):
+        days = self._days[:self._length]
+        start = np.searchsorted(days, np.datetime64(pd.Timestamp(start_date), 'D'), side='left')
+        stop = np.searchsorted(days, np.datetime64(pd.Timestamp(end_date), 'D'), side='right')
+        return start, stop
+
+    def max_last(self, days, fund=None):
+        """Highest price over the most recent `days` trading days.
+
+        Args:
+            days: number of most recent trading days
+            fund: fund name, or None for an array over all funds
+        """
+        return self._query(self._max, np.fmax, self._length - days, self._length, fund)
+
+    def min_last(self, days, fund=None):
+        """Lowest price over the most recent `days` trading days. See `max_last`."""
+        return self._query(self._min, np.fmin, self._length - days, self._length, fund)
+
+    def max_between(self, start_date, end_date, fund=None):
+        """Highest price over the dates from `start_date` to `end_date`, inclusive.
+
+        Args:
+            start_date: first date of the interval
+            end_date: last date of the interval
+            fund: fund name, or None for an array over all funds
+        """
+        return self._query(self._max, np.fmax, *self._date_bounds(start_date, end_date), fund)
+
+    def min_between(self, start_date, end_date, fund=None):
+        """Lowest price over the dates from `start_date` to `end_date`, inclusive. See `max_between`."""
+        return self._query(self._min, np.fmin, *self._date_bounds(start_date, end_date), fund)
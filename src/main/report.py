@@ -0,0 +1,235 @@
+"""
+report.py
+
+Headless batch report: imports the data, computes the valuations, what-if table and monthly statistics, and writes
+every figure and table to an output directory as HTML/PNG/CSV instead of showing them. Figures are rendered in
+parallel worker processes. Each artifact records a content hash of its inputs in a manifest, and is skipped on the next
+run if that hash is unchanged and its files still exist; the valuation and what-if table are only computed for
+artifacts that are rewritten.
+
+Run from src/main:
+    python report.py --output-dir report --formats html png
+"""
+import argparse
+from concurrent.futures import ProcessPoolExecutor
+from functools import cache
+import hashlib
+import json
+import os
+from os.path import exists, join
+import numpy as np
+import pandas as pd
+
+from instrumentation import enable, profiled, stage
+import TSP_analysis
+from plotting import POINT_BUDGET
+from scenarios import what_if_table
+from seasonality import monthly_loss_counts, seasonality_stats
+from valuation import value_contributions
+
+MANIFEST = 'report_manifest.json'
+FIGURE_FORMATS = ('html', 'png')
+WHAT_IF_RANGES = (15, 30, 280)
+SEASONAL_FUNDS = ['C FUND', 'S FUND', 'I FUND', 'F FUND']
+
+
+def input_hash(*inputs):
+    """SHA-256 of the content of DataFrames, Series and plain parameters, in order."""
+    digest = hashlib.sha256()
+    for item in inputs:
+        if isinstance(item, (pd.DataFrame, pd.Series)):
+            names = list(item.columns) if isinstance(item, pd.DataFrame) else [item.name]
+            digest.update(repr((type(item).__name__, item.shape, names)).encode())
+            digest.update(pd.util.hash_pandas_object(item, index=True).to_numpy().tobytes())
+        else:
+            digest.update(repr(item).encode())
+    return digest.hexdigest()
+
+
+def _render(builder, args, paths):
+    """Build a figure with a `TSP_analysis` figure builder and write it to each path, by file extension."""
+    fig = getattr(TSP_analysis, builder)(*args)
+    for path in paths:
+        with stage('write_figure', path=path):
+            if path.endswith('.html'):
+                fig.write_html(path, include_plotlyjs='cdn')
+            else:
+                fig.write_image(path, height=700, width=900, engine='kaleido')
+    return paths
+
+
+def _read_manifest(output_dir):
+    try:
+        with open(join(output_dir, MANIFEST)) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+
+def _write_manifest(output_dir, manifest):
+    path = join(output_dir, MANIFEST)
+    with open(path + '.tmp', 'w') as f:
+        json.dump(manifest, f, indent=2, sort_keys=True)
+    os.replace(path + '.tmp', path)
+
+
+def summary_table(contrib_dollars, current_shares, current_dollars, current_balance):
+    """Balance, gains and current holdings printed by `TSP_analysis.main`, as one table.
+
+    Returns:
+        DataFrame: shares, value and percentage of the balance per held fund, plus a 'Total' row with the balance and
+            the gains on personal and total contributions
+    """
+    held = current_shares > 0.001
+    table = pd.DataFrame({'Shares': current_shares[held], 'Value': current_dollars[held].to_numpy(),
+                          'Percent': 100 * current_dollars[held].to_numpy() / current_balance},
+                         index=current_dollars.index[held])
+    my_input = contrib_dollars['Traditional'].sum() + contrib_dollars['Roth'].sum()
+    table.loc['Total', ['Value', 'Percent']] = current_balance, 100.0
+    table['Gain on My Contribution'] = np.nan
+    table['Gain on Total Contribution'] = np.nan
+    table.loc['Total', 'Gain on My Contribution'] = current_balance - my_input
+    table.loc['Total', 'Gain on Total Contribution'] = current_balance - contrib_dollars['Total'].sum()
+    return table
+
+
+def build_report(output_dir, formats=('html',), workers=None, point_budget=POINT_BUDGET, force=False,
+                 contributions_path=join('resources', 'contributions.csv'),
+                 prices_path=join('resources', 'Share_Prices.csv')):
+    """Write all figures and tables of the analysis to a directory.
+
+    Args:
+        output_dir: directory to write the artifacts and the manifest to
+        formats: figure formats, 'html' and/or 'png' (PNG needs kaleido)
+        workers: number of processes rendering figures, all cores by default; 1 renders in this process
+        point_budget: see `plotting.decimate`
+        force: rewrite every artifact, even if its inputs have not changed
+        contributions_path: contributions CSV to import
+        prices_path: share price CSV to import
+
+    Returns:
+        dict: 'written' and 'skipped' artifact names
+    """
+    unknown = set(formats) - set(FIGURE_FORMATS)
+    if unknown:
+        raise ValueError(f"Unknown figure formats {sorted(unknown)}, expected any of {', '.join(FIGURE_FORMATS)}")
+    os.makedirs(output_dir, exist_ok=True)
+    prices_history, contrib_dollars, contrib_shares, current_shares, current_dollars, current_balance = \
+        TSP_analysis.import_data(contributions_path, prices_path)
+
+    # Computed only when an artifact using them is rewritten, and then once for both its table and its figure
+    @cache
+    def valuation():
+        return value_contributions(prices_history, contrib_shares, contrib_dollars)
+
+    ranges = list(WHAT_IF_RANGES) + [len(prices_history)]
+
+    @cache
+    def what_if():
+        # One scenario per fund: the whole balance moved into that fund
+        redistribution = np.eye(prices_history.shape[1])
+        table = what_if_table(ranges, redistribution, current_balance, current_shares, prices_history)
+        table.index = prices_history.columns
+        return table
+
+    # name: (inputs hashed, table producer) or (inputs hashed, figure builder, builder args producer)
+    funds = [fund for fund in SEASONAL_FUNDS if fund in prices_history.columns]
+    valuation_inputs = (prices_history, contrib_shares, contrib_dollars)
+    what_if_inputs = (prices_history, current_shares.tolist(), ranges)
+    tables = {
+        'summary': ((contrib_dollars, contrib_shares, prices_history.iloc[:1]),
+                    lambda: summary_table(contrib_dollars, current_shares, current_dollars, current_balance)),
+        'my_fund_value': (valuation_inputs, valuation),
+        'redistribution': (what_if_inputs, what_if),
+        'monthly_losses': ((prices_history, funds), lambda: monthly_loss_counts(prices_history, funds)),
+        'seasonality_month': ((prices_history, funds), lambda: seasonality_stats(prices_history, 'month', funds)),
+    }
+    figures = {
+        'share_prices_all_time': ((prices_history, point_budget), 'history_figure',
+                                  lambda: (prices_history, point_budget)),
+        'share_prices_past_year': ((prices_history, point_budget), 'history_figure',
+                                   lambda: (prices_history, point_budget, True)),
+        'my_fund_value': (valuation_inputs + (point_budget,), 'my_history_figure',
+                          lambda: (valuation(), point_budget)),
+        'redistribution': (what_if_inputs, 'what_if_figure', lambda: (what_if(),)),
+    }
+
+    manifest = _read_manifest(output_dir)
+    written, skipped = [], []
+
+    def unchanged(name, digest, paths):
+        entry = manifest.get(name)
+        return not force and entry is not None and entry['hash'] == digest and all(exists(p) for p in paths)
+
+    for name, (inputs, produce) in tables.items():
+        key, paths = f'{name}.csv', [join(output_dir, f'{name}.csv')]
+        digest = input_hash(key, *inputs)
+        if unchanged(key, digest, paths):
+            skipped.append(key)
+            continue
+        with stage('write_table', path=paths[0]) as current:
+            table = produce()
+            current.rows = len(table)
+            table.to_csv(paths[0])
+        manifest[key] = {'hash': digest, 'files': paths}
+        written.append(key)
+
+    jobs = {}
+    for name, (inputs, builder, args) in figures.items():
+        paths = [join(output_dir, f'{name}.{extension}') for extension in formats]
+        digest = input_hash(name, builder, *inputs)
+        if unchanged(name, digest, paths):
+            skipped.append(name)
+            continue
+        jobs[name] = (digest, builder, args(), paths)
+
+    if workers == 1 or len(jobs) <= 1:
+        for name, (digest, builder, args, paths) in jobs.items():
+            _render(builder, args, paths)
+            manifest[name] = {'hash': digest, 'files': paths}
+            written.append(name)
+    elif jobs:
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            futures = {name: executor.submit(_render, builder, args, paths)
+                       for name, (digest, builder, args, paths) in jobs.items()}
+            try:
+                for name, future in futures.items():
+                    manifest[name] = {'hash': jobs[name][0], 'files': future.result()}
+                    written.append(name)
+            finally:
+                # Keep the record of the artifacts written before a failure
+                _write_manifest(output_dir, manifest)
+
+    _write_manifest(output_dir, manifest)
+    return {'written': written, 'skipped': skipped}
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Write all TSP analysis figures and tables to a directory.')
+    parser.add_argument('--output-dir', default='report', help='directory to write the report to')
+    parser.add_argument('--prices', default=join('resources', 'Share_Prices.csv'), help='share price CSV')
+    parser.add_argument('--contributions', default=join('resources', 'contributions.csv'), help='contributions CSV')
+    parser.add_argument('--formats', nargs='+', default=['html'], choices=FIGURE_FORMATS,
+                        help='figure formats; PNG needs kaleido')
+    parser.add_argument('--workers', type=int, default=None, help='figure rendering processes, all cores by default')
+    parser.add_argument('--point-budget', type=int, default=POINT_BUDGET, help='points per line in the figures')
+    parser.add_argument('--force', action='store_true', help='rewrite artifacts whose inputs have not changed')
+    parser.add_argument('--instrument', metavar='LOG', default=None,
+                        help="log the wall time, rows and peak memory of each stage as JSON lines, '-' for stderr")
+    parser.add_argument('--profile', metavar='DIR', default=None, help='dump cProfile and tracemalloc results here')
+    args = parser.parse_args(argv)
+    if args.instrument:
+        enable(args.instrument)
+    if args.profile:
+        with profiled(args.profile):
+            result = build_report(args.output_dir, args.formats, args.workers, args.point_budget, args.force,
+                                  args.contributions, args.prices)
+    else:
+        result = build_report(args.output_dir, args.formats, args.workers, args.point_budget, args.force,
+                                  args.contributions, args.prices)
+    print(f"Wrote {len(result['written'])} artifacts, skipped {len(result['skipped'])} unchanged "
+          f"to {args.output_dir}")
+
+
+if __name__ == '__main__':
+    main()
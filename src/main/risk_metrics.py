@@ -0,0 +1,230 @@
+"""
+risk_metrics.py
+
+Risk metrics of the share price history: rolling volatility, drawdown, rolling beta and correlation of every fund
+against a benchmark fund, and trailing returns over several windows. `rolling_risk_metrics` computes them over the
+whole history in vectorized form. `RiskMetrics` keeps the running sums behind the latest values, so that a new day of
+prices updates them in O(funds), and can be saved and loaded between runs.
+"""
+import numpy as np
+import pandas as pd
+
+from history import TRADING_DAYS_PER_YEAR, clean_prices
+from instrumentation import instrumented
+
+SUMS = ['n', 's1', 's2', 'pn', 'px', 'pb', 'pxx', 'pbb', 'pxb']
+
+
+def _terms(returns, benchmark):
+    """Per-row terms of the running sums: counts, sums and sums of squares of the valid returns of each fund, and
+    the same over the days both the fund and the benchmark have returns, plus their cross products."""
+    valid = np.isfinite(returns)
+    x = np.where(valid, returns, 0.0)
+    pair = valid & valid[..., benchmark:benchmark + 1]
+    px = np.where(pair, x, 0.0)
+    pb = np.where(pair, x[..., benchmark:benchmark + 1], 0.0)
+    return {'n': valid.astype(float), 's1': x, 's2': x * x, 'pn': pair.astype(float), 'px': px, 'pb': pb,
+            'pxx': px * px, 'pbb': pb * pb, 'pxb': px * pb}
+
+
+def _metrics(sums):
+    """Annualized volatility, beta and correlation from running sums."""
+    with np.errstate(divide='ignore', invalid='ignore'):
+        n, pn = sums['n'], sums['pn']
+        variance = np.where(n > 1, (sums['s2'] - sums['s1'] ** 2 / n) / (n - 1), np.nan)
+        var_x = (sums['pxx'] - sums['px'] ** 2 / pn) / (pn - 1)
+        var_b = (sums['pbb'] - sums['pb'] ** 2 / pn) / (pn - 1)
+        cov = np.where(pn > 1, (sums['pxb'] - sums['px'] * sums['pb'] / pn) / (pn - 1), np.nan)
+        return {'volatility': np.sqrt(np.maximum(variance, 0)) * np.sqrt(TRADING_DAYS_PER_YEAR),
+                'beta': cov / var_b,
+                'correlation': cov / np.sqrt(var_x * var_b)}
+
+
+@instrumented()
+def rolling_risk_metrics(prices, window=63, benchmark='C FUND', return_windows=(21, 63, 252)):
+    """Risk metrics of every fund on every day of the history.
+
+    Args:
+        prices: share price history, in any date order
+        window: rolling window in trading days for volatility, beta and correlation
+        benchmark: fund the beta and correlation are measured against
+        return_windows: trading days of the trailing returns
+
+    Returns:
+        dict of DataFrame, oldest first with one column per fund: 'volatility' (annualized), 'beta', 'correlation',
+            'drawdown' (from the running peak), 'max_drawdown' (worst drawdown so far) and 'return_<k>d' for each
+            trailing return window
+    """
+    prices = clean_prices(prices)
+    values = prices.to_numpy(dtype=float)
+    returns = np.vstack([np.full((1, values.shape[1]), np.nan), values[1:] / values[:-1] - 1])
+
+    rolling = {}
+    for name, term in _terms(returns, prices.columns.get_loc(benchmark)).items():
+        total = np.vstack([np.zeros((1, term.shape[1])), np.cumsum(term, axis=0)])
+        rolling[name] = total[1:] - total[np.maximum(np.arange(1, len(total)) - window, 0)]
+    frames = {name: pd.DataFrame(metric, index=prices.index, columns=prices.columns)
+              for name, metric in _metrics(rolling).items()}
+
+    drawdown = prices / prices.cummax() - 1
+    frames['drawdown'] = drawdown
+    frames['max_drawdown'] = drawdown.cummin()
+    for days in return_windows:
+        frames[f'return_{days}d'] = prices / prices.shift(days) - 1
+    return frames
+
+
+class RiskMetrics:
+    """Latest risk metrics of every fund, updated one day at a time.
+
+    Build it with `from_prices`, add new days with `update` or `extend`, read the values with `snapshot` and keep the
+    state between runs with `save` and `load`.
+    """
+
+    def __init__(self, funds, window=63, benchmark='C FUND', return_windows=(21, 63, 252)):
+        self.funds = list(funds)
+        self.window = window
+        self.benchmark = benchmark
+        self.return_windows = tuple(return_windows)
+        n_funds = len(self.funds)
+        self.date = None
+        self.sums = {name: np.zeros(n_funds) for name in SUMS}
+        self.returns = np.full((window, n_funds), np.nan)  # ring buffer of the last `window` daily returns
+        self.prices = np.full((max(self.return_windows) + 1, n_funds), np.nan)  # ring buffer of recent prices
+        self.position = 0  # number of days added so far
+        self.peak = np.full(n_funds, np.nan)
+        self.max_drawdown = np.full(n_funds, np.nan)
+
+    @classmethod
+    def from_prices(cls, prices, window=63, benchmark='C FUND', return_windows=(21, 63, 252)):
+        """Build the state from a whole price history in one vectorized pass."""
+        metrics = cls(prices.columns, window, benchmark, return_windows)
+        prices = clean_prices(prices)
+        values = prices.to_numpy(dtype=float)
+        if len(values) == 0:
+            return metrics
+        returns = np.vstack([np.full((1, values.shape[1]), np.nan), values[1:] / values[:-1] - 1])
+
+        recent = returns[-window:]
+        metrics.sums = {name: term.sum(axis=0) for name, term in _terms(recent, metrics._benchmark).items()}
+        metrics.position = len(values)
+        rows = np.arange(len(values) - len(recent), len(values))
+        metrics.returns[rows % window] = recent
+        rows = np.arange(max(len(values) - len(metrics.prices), 0), len(values))
+        metrics.prices[rows % len(metrics.prices)] = values[rows]
+        running_peak = np.fmax.accumulate(values, axis=0)
+        metrics.peak = running_peak[-1]
+        metrics.max_drawdown = np.fmin.reduce(values / running_peak - 1, axis=0)
+        metrics.date = prices.index[-1]
+        return metrics
+
+    @property
+    def _benchmark(self):
+        return self.funds.index(self.benchmark)
+
+    def update(self, date, prices):
+        """Add one day of prices, newer than every day already added, in O(funds).
+
+        Args:
+            date: date of the prices
+            prices: share price of each fund, in the order of `funds`
+        """
+        date = pd.Timestamp(date)
+        if self.date is not None and date <= self.date:
+            raise ValueError(f'Prices for {date:%m/%d/%Y} are not newer than {self.date:%m/%d/%Y}')
+        row = np.asarray(prices, dtype=float)
+        row = np.where(row > 0, row, np.nan)
+        previous = self.prices[(self.position - 1) % len(self.prices)]
+        daily_return = row / previous - 1
+
+        # Slide the window: take out the return leaving it and add the new one
+        slot = self.position % self.window
+        for name, term in _terms(self.returns[slot], self._benchmark).items():
+            self.sums[name] -= term
+        for name, term in _terms(daily_return, self._benchmark).items():
+            self.sums[name] += term
+        self.returns[slot] = daily_return
+        self.prices[self.position % len(self.prices)] = row
+        self.position += 1
+        if self.position % self.window == 0:
+            # Re-sum the window now and then so rounding errors of the running sums do not build up
+            self.sums = {name: term.sum(axis=0) for name, term in _terms(self.returns, self._benchmark).items()}
+
+        with np.errstate(invalid='ignore'):
+            self.peak = np.fmax(self.peak, row)
+            self.max_drawdown = np.fmin(self.max_drawdown, row / self.peak - 1)
+        self.date = date
+
+    def extend(self, new_prices):
+        """Add several days of prices, e.g. the rows returned by `share_prices.ingest_share_prices`."""
+        for date, row in clean_prices(new_prices)[self.funds].iterrows():
+            self.update(date, row.to_numpy())
+
+    def snapshot(self):
+        """Latest metrics.
+
+        Returns:
+            DataFrame: one row per fund with volatility, beta, correlation, drawdown, max drawdown and trailing returns
+        """
+        latest = self.prices[(self.position - 1) % len(self.prices)]
+        snapshot = _metrics(self.sums)
+        with np.errstate(invalid='ignore'):
+            snapshot['drawdown'] = latest / self.peak - 1
+            snapshot['max_drawdown'] = self.max_drawdown
+            for days in self.return_windows:
+                past = self.prices[(self.position - 1 - days) % len(self.prices)] if self.position > days else np.nan
+                snapshot[f'return_{days}d'] = latest / past - 1
+        return pd.DataFrame(snapshot, index=pd.Index(self.funds, name=self.date))
+
+    def save(self, path):
+        """Save the state to a .npz file."""
+        np.savez(path, funds=np.array(self.funds), window=self.window, benchmark=self.benchmark,
+                 return_windows=np.array(self.return_windows), date=np.datetime64(self.date, 'ns'),
+                 returns=self.returns, prices=self.prices, position=self.position, peak=self.peak,
+                 max_drawdown=self.max_drawdown, **self.sums)
+
+    @classmethod
+    def load(cls, path):
+        """Load a state saved with `save`."""
+        with np.load(path) as state:
+            metrics = cls(state['funds'].tolist(), int(state['window']), str(state['benchmark']),
+                          state['return_windows'].tolist())
+            date = state['date'][()]
+            metrics.date = None if np.isnat(date) else pd.Timestamp(date)
+            metrics.sums = {name: state[name] for name in SUMS}
+            metrics.returns = state['returns']
+            metrics.prices = state['prices']
+            metrics.position = int(state['position'])
+            metrics.peak = state['peak']
+            metrics.max_drawdown = state['max_drawdown']
+        return metrics
+
+
+@instrumented()
+def update_risk_metrics(prices, state_path, **kwargs):
+    """Bring saved risk metrics up to date with the price history, adding only the days after the saved state.
+
+    The state is rebuilt from scratch if it does not exist or was saved with different settings or funds.
+
+    Args:
+        prices: share price history
+        state_path: .npz file of the saved `RiskMetrics`
+        **kwargs: window, benchmark and return_windows, see `RiskMetrics`
+
+    Returns:
+        RiskMetrics: the updated metrics, also saved to `state_path`
+    """
+    metrics = None
+    try:
+        metrics = RiskMetrics.load(state_path)
+    except (OSError, KeyError, ValueError):
+        pass
+    expected = RiskMetrics(prices.columns, **kwargs)
+    if metrics is None or metrics.date is None or \
+            (metrics.funds, metrics.window, metrics.benchmark, metrics.return_windows) != \
+            (expected.funds, expected.window, expected.benchmark, expected.return_windows):
+        metrics = RiskMetrics.from_prices(prices, **kwargs)
+    else:
+        metrics.extend(prices[prices.index > metrics.date])
+    metrics.save(state_path)
+    return metrics
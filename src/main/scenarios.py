@@ -0,0 +1,69 @@
+"""
+scenarios.py
+
+Scores "what-if" fund redistributions against the share price history. Every scenario and every look-back window
+is evaluated in one matrix operation from the maximum share price of each fund over each window.
+"""
+import numpy as np
+import pandas as pd
+
+
+def window_label(days, history_length):
+    """Column label for a look-back window of `days` trading days."""
+    return 'Over All Time' if days >= history_length else f'{days} days'
+
+
+def window_maxima(prices_history, ranges, price_index=None):
+    """Maximum share price of each fund over the most recent rows of the history.
+
+    Args:
+        prices_history: share price history, newest first
+        ranges: look-back windows in trading days
+        price_index: optional `PriceRangeIndex` over `prices_history`, answering each window in constant time
+
+    Returns:
+        ndarray: windows x funds array of maximum prices, ignoring missing prices
+    """
+    if price_index is not None:
+        return np.array([price_index.max_last(days) for days in ranges])
+    running_max = np.fmax.accumulate(prices_history.to_numpy(dtype=float), axis=0)
+    rows = np.clip(np.asarray(ranges, dtype=int), 1, len(running_max)) - 1
+    return running_max[rows]
+
+
+def score_redistributions(redistribution, ranges, current_balance, current_shares, prices_history, price_index=None):
+    """Gain or loss of each redistribution relative to keeping the current shares, for every window.
+
+    For a window, each fund is assumed to rise to its highest price over that window. The score is the gain of
+    moving the whole balance into the redistribution minus the gain of holding the current shares.
+
+    Args:
+        redistribution: scenarios x funds array of fractions of the balance to put in each fund
+        ranges: look-back windows in trading days
+        current_balance: current balance of TSP account
+        current_shares: current amount of shares owned per fund
+        prices_history: share price history, newest first
+        price_index: optional `PriceRangeIndex` over `prices_history`
+
+    Returns:
+        ndarray: scenarios x windows array of gains/losses in dollars
+    """
+    redistribution = np.atleast_2d(np.asarray(redistribution, dtype=float))
+    today_prices = prices_history.iloc[0].to_numpy(dtype=float)
+    range_max_price = window_maxima(prices_history, ranges, price_index)
+
+    scenario_total = current_balance * redistribution @ (range_max_price / today_prices).T
+    current_total = range_max_price @ np.asarray(current_shares, dtype=float)
+    return scenario_total - current_total
+
+
+def what_if_table(ranges, redistribution, current_balance, current_shares, prices_history, price_index=None):
+    """Tabulate `score_redistributions` with one row per scenario and one column per window.
+
+    Returns:
+        DataFrame: gains/losses indexed by redistribution number
+    """
+    scores = score_redistributions(redistribution, ranges, current_balance, current_shares, prices_history,
+                                   price_index)
+    columns = [window_label(days, len(prices_history)) for days in ranges]
+    return pd.DataFrame(scores, columns=columns, index=pd.RangeIndex(len(scores), name='Redistribution'))
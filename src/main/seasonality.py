@@ -0,0 +1,96 @@
+"""
+seasonality.py
+
+Seasonality statistics of the share price history: how often each fund lost money, its mean and median return and
+its hit rate (share of periods with a gain) per calendar month, week of the year or day of the week. Every statistic is
+a groupby aggregation over the whole price matrix.
+"""
+import calendar
+import pandas as pd
+
+from history import clean_prices
+from instrumentation import instrumented
+
+STATISTICS = ['loss_count', 'mean', 'median', 'hit_rate']
+
+
+def period_returns(prices, period='month', funds=None, method='period'):
+    """Return of each fund over every month, week or trading day in the history.
+
+    Args:
+        prices: share price history, in any date order
+        period: 'month', 'week' or 'weekday' (single trading days)
+        funds: optional list of funds to include
+        method: 'period' for the change from the first to the last price within each period, or 'daily' for the sum
+            of the daily returns within each period
+
+    Returns:
+        DataFrame: returns per fund, indexed by the calendar label of each period (month number, ISO week number or
+            day of the week with Monday=0), one row per period
+    """
+    prices = clean_prices(prices if funds is None else prices[list(funds)])
+    dates = prices.index
+    if period == 'weekday':
+        returns = prices.pct_change(fill_method=None).iloc[1:]
+        return returns.set_axis(returns.index.dayofweek.rename(period))
+    if period == 'month':
+        key = dates.year * 100 + dates.month
+    elif period == 'week':
+        iso = dates.isocalendar()
+        key = iso['year'].to_numpy() * 100 + iso['week'].to_numpy()
+    else:
+        raise ValueError(f"Unknown period '{period}', expected 'month', 'week' or 'weekday'")
+
+    key = pd.Index(key, name=period)
+    if method == 'period':
+        grouped = prices.set_axis(key).groupby(level=0, sort=True)
+        returns = grouped.last() / grouped.first() - 1
+    elif method == 'daily':
+        daily = prices.pct_change(fill_method=None).set_axis(key)
+        first_of_period = key.to_numpy() != pd.Series(key).shift().to_numpy()
+        daily.loc[first_of_period] = float('nan')
+        returns = daily.groupby(level=0, sort=True).sum(min_count=1)
+    else:
+        raise ValueError(f"Unknown method '{method}', expected 'period' or 'daily'")
+    # Keys are year * 100 + month (or ISO week), so the calendar label is the remainder
+    return returns.set_axis(pd.Index(returns.index % 100, name=period))
+
+
+@instrumented()
+def seasonality_stats(prices, period='month', funds=None, method='period'):
+    """Loss count, mean and median return and hit rate of each fund per calendar month, week or weekday.
+
+    Args:
+        prices: share price history, in any date order
+        period: 'month', 'week' or 'weekday'
+        funds: optional list of funds to include
+        method: how returns are measured within a period, see `period_returns`
+
+    Returns:
+        DataFrame: indexed by calendar label, with (statistic, fund) columns for each of `STATISTICS`
+    """
+    returns = period_returns(prices, period, funds, method)
+    by_label = returns.groupby(level=0, sort=True)
+    stats = {
+        'loss_count': (returns < 0).groupby(level=0, sort=True).sum(),
+        'mean': by_label.mean(),
+        'median': by_label.median(),
+        'hit_rate': (returns > 0).groupby(level=0, sort=True).sum() / by_label.count(),
+    }
+    stats = pd.concat(stats, axis=1)
+    if period == 'month':
+        stats.index = pd.Index([calendar.month_abbr[m] for m in stats.index], name=period)
+    elif period == 'weekday':
+        stats.index = pd.Index([calendar.day_abbr[d] for d in stats.index], name=period)
+    return stats
+
+
+@instrumented()
+def monthly_loss_counts(prices, funds=None, method='period'):
+    """Number of years in which each fund lost value in each calendar month.
+
+    Returns:
+        DataFrame: loss counts indexed Jan..Dec, one column per fund
+    """
+    counts = seasonality_stats(prices, 'month', funds, method)['loss_count']
+    return counts.reindex(list(calendar.month_abbr)[1:], fill_value=0)
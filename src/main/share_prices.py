@@ -0,0 +1,201 @@
+"""
+share_prices.py
+
+Incremental updates of the share price history file. New prices come from the TSP share price history table, either
+as the text of the table scraped by `TSPInterface` or as a saved HTML/text snapshot of the page. Only the rows newer
+than the newest stored date are parsed, validated and written, so the history is never re-parsed.
+"""
+from html.parser import HTMLParser
+import math
+import os
+import shutil
+import pandas as pd
+
+from csv_cache import format_csv_dates
+
+TABLE_ID = 'dynamic-share-price-table'
+
+
+def canonical_fund_name(name):
+    """Spell a fund name the way Share_Prices.csv does, e.g. 'L Income' -> 'L INC' and 'G Fund' -> 'G FUND'."""
+    name = ' '.join(name.upper().split())
+    return 'L INC' if name == 'L INCOME' else name
+
+
+class _TableParser(HTMLParser):
+    """Collect the text of every cell, row by row, of the share price table in a page."""
+
+    def __init__(self, table_id=TABLE_ID):
+        super().__init__()
+        self.table_id = table_id
+        self.rows = []
+        self._depth = 0
+        self._cell = None
+
+    def handle_starttag(self, tag, attrs):
+        if tag == 'table' and (self._depth or dict(attrs).get('id') == self.table_id):
+            self._depth += 1
+        elif self._depth and tag == 'tr':
+            self.rows.append([])
+        elif self._depth and tag in ('td', 'th'):
+            self._cell = []
+
+    def handle_endtag(self, tag):
+        if tag == 'table' and self._depth:
+            self._depth -= 1
+        elif self._cell is not None and tag in ('td', 'th'):
+            self.rows[-1].append(' '.join(''.join(self._cell).split()))
+            self._cell = None
+
+    def handle_data(self, data):
+        if self._cell is not None:
+            self._cell.append(data)
+
+
+def _to_frame(header, rows):
+    """Build a newest-first price dataframe from the header and row cells of the share price table."""
+    columns = [canonical_fund_name(col) for col in header[1:]]
+    df = pd.DataFrame([row[1:] for row in rows], columns=columns)
+    df.index = pd.DatetimeIndex(pd.to_datetime([row[0] for row in rows]), name='Date')
+    for col in df.columns:
+        cells = df[col].str.replace('$', '', regex=False).str.replace(',', '', regex=False).str.strip()
+        df[col] = pd.to_numeric(cells.replace({'': None, '-': None, 'N/A': None}))
+    return df.sort_index(ascending=False)
+
+
+def parse_share_price_text(text):
+    """Parse the text of the share price table, as returned by Selenium for `dynamic-share-price-table`.
+
+    :param text: table text with a 'Date <fund> <fund> ...' header line and '<date> $<price> $<price> ...' rows
+    :return: DataFrame of share prices indexed by date, newest first
+    """
+    lines = [line for line in text.splitlines() if line.strip()]
+    names = lines[0].split()[1:]
+    header = ['Date'] + [' '.join(names[i:i + 2]) for i in range(0, len(names), 2)]
+    rows = [[cell.strip() for cell in line.split('$')] for line in lines[1:]]
+    return _to_frame(header, rows)
+
+
+def parse_share_price_html(html):
+    """Parse the share price table out of a saved copy of https://www.tsp.gov/share-price-history/.
+
+    :param html: page source
+    :return: DataFrame of share prices indexed by date, newest first
+    """
+    parser = _TableParser()
+    parser.feed(html)
+    rows = [row for row in parser.rows if row]
+    if not rows:
+        raise ValueError(f'No table with id "{TABLE_ID}" found')
+    return _to_frame(rows[0], rows[1:])
+
+
+def read_snapshot(snapshot_path):
+    """Parse a saved HTML page or table text snapshot of the share price history.
+
+    :param snapshot_path: path to the snapshot file
+    :return: DataFrame of share prices indexed by date, newest first
+    """
+    with open(snapshot_path, encoding='utf-8') as f:
+        content = f.read()
+    if '<table' in content.lower():
+        return parse_share_price_html(content)
+    return parse_share_price_text(content)
+
+
+def _read_layout(csv_path):
+    """Header, line ending, newest stored date and whether the file is newest first, reading only its ends."""
+    with open(csv_path, 'rb') as f:
+        header = f.readline()
+        first = f.readline()
+        second = f.readline()
+        f.seek(0, os.SEEK_END)
+        f.seek(max(f.tell() - 4096, 0))
+        last = f.read().splitlines()[-1]
+
+    newline = b'\r\n' if header.endswith(b'\r\n') else b'\n'
+    columns = header.decode().strip().split(',')
+
+    def row_date(line):
+        return pd.to_datetime(line.decode().split(',', 1)[0], format='%m/%d/%Y')
+
+    if not first.strip():
+        return columns, newline, None, True
+    newest_first = not second.strip() or row_date(first) >= row_date(second)
+    return columns, newline, row_date(first if newest_first else last), newest_first
+
+
+def newest_stored_date(csv_path):
+    """Date of the most recent price in a share price CSV, read without parsing the rest of the file."""
+    return _read_layout(csv_path)[2]
+
+
+def _format_rows(prices, newline):
+    lines = []
+    for date, row in zip(format_csv_dates(prices.index), prices.itertuples(index=False)):
+        cells = ['' if math.isnan(value) else repr(float(value)) for value in row]
+        lines.append(','.join([date] + cells).encode() + newline)
+    return b''.join(lines)
+
+
+def validate_prices(prices, columns):
+    """Check new share prices against the stored columns and drop duplicate dates.
+
+    :param prices: DataFrame of share prices indexed by date
+    :param columns: fund columns of the share price CSV
+    :return: the prices reordered to the CSV columns, one row per date
+    :raises ValueError: for unknown funds, prices that are not positive, or rows missing the price of a stored fund,
+        which would otherwise be written as blank cells
+    """
+    unknown = [col for col in prices.columns if col not in columns]
+    if unknown:
+        raise ValueError(f'Funds not in the share price file: {", ".join(unknown)}')
+    prices = prices.reindex(columns=columns).astype(float)
+    if (prices <= 0).any().any():
+        raise ValueError('Share prices must be positive')
+    missing = prices.columns[prices.isna().any()]
+    if len(missing):
+        dates = prices.index[prices.isna().any(axis=1)]
+        raise ValueError(f'No price for {", ".join(missing)} on {", ".join(format_csv_dates(dates))}')
+    return prices[~prices.index.duplicated(keep='first')]
+
+
+def ingest_share_prices(prices, csv_path):
+    """Write the prices newer than the newest stored date into the share price CSV.
+
+    The file keeps its date order. For a newest-first file the new rows are written to a temporary file followed by a
+    byte copy of the existing rows, which then atomically replaces the original; nothing already stored is parsed.
+
+    :param prices: DataFrame of share prices indexed by date, e.g. from `read_snapshot`
+    :param csv_path: path to Share_Prices.csv
+    :return: DataFrame of the rows that were added, newest first
+    """
+    columns, newline, newest, newest_first = _read_layout(csv_path)
+    if newest is not None:
+        prices = prices[prices.index > newest]
+    new_rows = validate_prices(prices, columns[1:]).sort_index(ascending=False)
+    if new_rows.empty:
+        return new_rows
+
+    if not newest_first:
+        with open(csv_path, 'ab') as f:
+            f.write(_format_rows(new_rows.sort_index(), newline))
+        return new_rows
+
+    tmp_path = f'{csv_path}.{os.getpid()}.tmp'
+    with open(csv_path, 'rb') as src, open(tmp_path, 'wb') as dst:
+        dst.write(src.readline())
+        dst.write(_format_rows(new_rows, newline))
+        shutil.copyfileobj(src, dst)
+    os.replace(tmp_path, csv_path)
+    return new_rows
+
+
+def ingest_snapshot(snapshot_path, csv_path):
+    """Add the new prices of a saved share price page or table text to the share price CSV.
+
+    :param snapshot_path: path to an HTML or text snapshot of the share price table
+    :param csv_path: path to Share_Prices.csv
+    :return: DataFrame of the rows that were added, newest first
+    """
+    return ingest_share_prices(read_snapshot(snapshot_path), csv_path)
@@ -0,0 +1,105 @@
+"""
+synthetic_data.py
+
+Synthetic share price and contribution histories of any size, for benchmarks. Prices follow a geometric Brownian
+motion per fund, driven by one common market factor so the funds are correlated like the real ones, and are laid out
+like Share_Prices.csv: newest first, with a price of 0 before a fund's inception. Contributions follow a biweekly pay
+schedule laid out like contributions.csv.
+"""
+import numpy as np
+import pandas as pd
+
+from csv_cache import format_csv_dates
+from history import DOLLAR_COLUMNS, TRADING_DAYS_PER_YEAR
+
+FUNDS = ['L INC', 'L 2025', 'L 2030', 'L 2035', 'L 2040', 'L 2045', 'L 2050', 'L 2055', 'L 2060', 'L 2065',
+         'G FUND', 'F FUND', 'C FUND', 'S FUND', 'I FUND']
+# Annual drift, volatility and exposure to the market factor per fund, roughly those of the real funds
+FUND_PARAMETERS = {'G FUND': (0.025, 0.003, 0.0), 'F FUND': (0.03, 0.05, 0.05), 'C FUND': (0.10, 0.18, 1.0),
+                   'S FUND': (0.10, 0.23, 1.1), 'I FUND': (0.06, 0.19, 0.85), 'L INC': (0.04, 0.04, 0.2)}
+L_FUND_PARAMETERS = (0.07, 0.14, 0.75)
+
+
+def synthetic_prices(years=20, funds=FUNDS, end='2023-12-29', late_funds=0.2, seed=None):
+    """Daily share prices of every fund over a number of years.
+
+    Args:
+        years: length of the history in years of 252 trading days
+        funds: fund names; funds without their own parameters move like an L fund
+        end: date of the newest row
+        late_funds: fraction of the funds, other than the G, F, C, S and I funds, that start part way through the
+            history and have a price of 0 before then
+        seed: seed for reproducible histories
+
+    Returns:
+        DataFrame: share prices indexed by business day, newest first
+    """
+    rng = np.random.default_rng(seed)
+    n_days = int(round(years * TRADING_DAYS_PER_YEAR))
+    # Nanosecond dates, as read_dated_csv returns them, so as-of joins against them match
+    dates = pd.bdate_range(end=end, periods=n_days, name='Date').as_unit('ns')
+    drift, volatility, beta = np.array([FUND_PARAMETERS.get(fund, L_FUND_PARAMETERS) for fund in funds]).T
+
+    market = rng.standard_normal((n_days, 1))
+    own = rng.standard_normal((n_days, len(funds)))
+    weight = np.minimum(beta, 1.0)
+    shocks = weight * market + np.sqrt(1 - weight ** 2) * own
+    daily = ((drift - volatility ** 2 / 2) / TRADING_DAYS_PER_YEAR +
+             volatility / np.sqrt(TRADING_DAYS_PER_YEAR) * shocks)
+    start_prices = rng.uniform(10, 50, len(funds))
+    prices = start_prices * np.exp(np.cumsum(daily, axis=0))
+
+    core = np.isin(funds, list(FUND_PARAMETERS))
+    late = rng.permutation(np.flatnonzero(~core))[:int(round(late_funds * (~core).sum()))]
+    for fund in late:
+        inception = rng.integers(1, n_days)
+        prices[:inception, fund] = 0.0
+        prices[inception:, fund] *= 10 / prices[inception, fund]
+    return pd.DataFrame(prices[::-1].round(4), index=dates[::-1], columns=list(funds))
+
+
+def synthetic_contributions(prices, years=None, every=10, paycheck=2000.0, roth=0.5, rate=0.1, seed=None):
+    """Biweekly contributions invested in random fixed fractions of the funds that exist on each pay day.
+
+    Args:
+        prices: share price history, e.g. from `synthetic_prices`
+        years: length of the contribution history ending on the newest price, the whole price history by default
+        every: trading days between pay days
+        paycheck: gross pay per pay day
+        roth: fraction of the employee contribution that is Roth instead of Traditional
+        rate: fraction of the paycheck contributed by the employee; the agency adds 1% plus a match of up to 4%
+        seed: seed for reproducible schedules
+
+    Returns:
+        DataFrame: contribution history indexed by date, oldest first, with the contributions.csv columns
+    """
+    rng = np.random.default_rng(seed)
+    history = prices.sort_index()
+    if years is not None:
+        history = history.iloc[-int(round(years * TRADING_DAYS_PER_YEAR)):]
+    pay_days = history.iloc[::every]
+    values = pay_days.to_numpy()
+    weights = rng.dirichlet(np.ones(len(history.columns)), size=1) * (values > 0)
+    weights = weights / weights.sum(axis=1, keepdims=True)
+
+    employee = paycheck * rate
+    match = paycheck * (min(rate, 0.03) + max(min(rate, 0.05) - 0.03, 0) / 2)
+    dollars = np.tile([employee * (1 - roth), employee * roth, paycheck * 0.01, match], (len(pay_days), 1))
+    total = dollars.sum(axis=1)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        shares = np.where(values > 0, total[:, None] * weights / values, 0.0).round(4)
+    contributions = pd.DataFrame(np.column_stack([dollars, total, shares]), index=pay_days.index,
+                                 columns=DOLLAR_COLUMNS + list(history.columns))
+    return contributions
+
+
+def random_redistributions(n_scenarios, n_funds, seed=None):
+    """Random "what-if" redistributions: scenarios x funds fractions of the balance, each row summing to 1."""
+    return np.random.default_rng(seed).dirichlet(np.ones(n_funds), size=n_scenarios)
+
+
+def write_csv(df, csv_path):
+    """Write a dated frame in the layout of the resources CSVs, with unpadded m/d/Y dates and in its row order."""
+    out = df.copy()
+    out.index = pd.Index(format_csv_dates(df.index), name='Date')
+    out.to_csv(csv_path, float_format='%.10g')
@@ -0,0 +1,92 @@
+"""
+valuation.py
+
+Values a contribution history against the share price history in a single batched pass, without any plotting.
+Cumulative shares come from a running sum over the contributions and the matching share prices come from an as-of
+lookup (see `history.AsOfIndex`), so each contribution is valued at the most recent price on or before its date.
+"""
+import pandas as pd
+
+from history import AsOfIndex
+from instrumentation import instrumented
+from share_prices import canonical_fund_name
+
+SUMMARY_COLUMNS = ['Total Value', 'Total Contribution', 'My Contribution', 'Fund Gain']
+
+
+def cumulative_shares(contrib_shares):
+    """Running total of shares owned per fund after each contribution.
+
+    Args:
+        contrib_shares: contribution history in shares, one row per contribution, in any date order
+
+    Returns:
+        DataFrame: shares owned per fund after each contribution, in date order
+    """
+    return contrib_shares.sort_index(kind='stable').cumsum()
+
+
+def asof_prices(share_history, dates, asof_index=None):
+    """Look up the share prices in effect on each date.
+
+    Args:
+        share_history: share price history, in any date order
+        dates: DatetimeIndex of dates to price, in any order
+        asof_index: optional `AsOfIndex` built once over share_history, to skip sorting it on every call
+
+    Returns:
+        ndarray: one row of fund prices per date, NaN for dates before the first price
+    """
+    if asof_index is None:
+        asof_index = AsOfIndex.from_frame(share_history)
+    return asof_index.lookup(dates)
+
+
+def align_shares(contrib_shares, funds):
+    """Contribution shares with one column per fund of the share price history, matched by canonical fund name.
+
+    Args:
+        contrib_shares: contribution history in shares, with fund names spelled either way, e.g. 'G Fund'
+        funds: fund columns of the share price history
+
+    Returns:
+        DataFrame: shares in the order of `funds`, 0 for funds without contributions
+    """
+    names = [canonical_fund_name(fund) for fund in funds]
+    shares = contrib_shares.set_axis([canonical_fund_name(fund) for fund in contrib_shares.columns], axis=1)
+    unknown = set(shares.columns) - set(names)
+    if unknown:
+        raise ValueError(f"Contributions to unknown funds: {', '.join(sorted(unknown))}")
+    shares = shares.reindex(columns=names, fill_value=0.0)
+    shares.columns = list(funds)
+    return shares
+
+
+@instrumented(rows=len)
+def value_contributions(share_history, contrib_shares, contrib_dollars, asof_index=None):
+    """Compute the value of every fund and of the whole account after each contribution.
+
+    Fund columns are matched to the share price columns by canonical fund name (see `align_shares`), so the
+    contribution file may spell them differently or list them in another order.
+
+    Args:
+        share_history: share price history
+        contrib_shares: contribution history in shares, in any date order
+        contrib_dollars: contribution history in dollars, in any date order
+        asof_index: optional `AsOfIndex` built once over share_history, e.g. when valuing many accounts
+
+    Returns:
+        DataFrame: dollar value per fund plus Total Value, Total Contribution, My Contribution and Fund Gain,
+            indexed by contribution date; values and gains are NaN for contributions before the first share price
+    """
+    shares = cumulative_shares(align_shares(contrib_shares, share_history.columns))
+    dollars = contrib_dollars.sort_index(kind='stable').cumsum()
+
+    value = pd.DataFrame(shares.to_numpy() * asof_prices(share_history, shares.index, asof_index),
+                         index=shares.index, columns=shares.columns)
+    # Contributions before the first price cannot be valued, so their total stays NaN instead of counting as 0
+    value['Total Value'] = value.sum(axis=1, skipna=False)
+    value['Total Contribution'] = dollars['Total'].to_numpy()
+    value['My Contribution'] = (dollars['Traditional'] + dollars['Roth']).to_numpy()
+    value['Fund Gain'] = value['Total Value'] - value['Total Contribution']
+    return value